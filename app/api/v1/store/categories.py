@@ -2,7 +2,7 @@ import logging
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
 from services.posts import perfome_create_category, perfome_create_subcategory
-from crud.categories import crud_category, crud_subcategory
+from services.category_registry import category_registry
 from dependencies.db import get_async_session
 from sqlalchemy.ext.asyncio import AsyncSession
 from schemas.categories import (
@@ -82,7 +82,7 @@ async def get_all_categories(
     """
     try:
 
-        return await crud_category.get_multi(db, offset=offset, limit=limit)
+        return await category_registry.get_categories(db, offset=offset, limit=limit)
 
     except HTTPException as e:
         raise e
@@ -102,7 +102,9 @@ async def get_categiries(
 
     try:
 
-        return await crud_subcategory.get_multi(db, offset=offset, limit=limit)
+        return await category_registry.get_subcategories(
+            db, offset=offset, limit=limit
+        )
 
     except HTTPException as e:
         raise e
@@ -124,12 +126,12 @@ async def get_category_by_slug(
 ):
     # First, fetch the category by its title to get its ID
     try:
-        category = await crud_category.get(db, slug=category_slug)
+        category = await category_registry.get_category(db, slug=category_slug)
         if not category:
             raise HTTPException(status_code=404, detail="Category not found")
 
         # Then, fetch subcategories that belong to this category
-        return await crud_subcategory.get_multi(
+        return await category_registry.get_subcategories(
             db, category_id=category.id, offset=offset, limit=limit
         )
 
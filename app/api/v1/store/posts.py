@@ -1,38 +1,46 @@
+from collections import defaultdict
 from datetime import date, datetime
 import logging
-import os
-from typing import List, Optional
+import uuid
+from typing import List, Literal, Optional
 from fastapi import APIRouter, Depends, File, HTTPException, Query, status, UploadFile
 from utils.posts import (
+    attach_post_images,
     check_user_posts_limits,
+    post_image_info,
     prepare_post_data_for_response,
+    prepare_posts_data_for_response,
     validate_and_transform_category_subcategory,
     validate_owner,
     validate_post_create_data,
 )
 from configs.general import (
-    POSTS_PICTURES_DIR,
     VIPS_POST_IMAGES_LIMIT,
     POST_IMAGES_LIMIT,
 )
-from tasks.store import upload_picture
+from utils.uploads import discard_staged_uploads, get_upload_job_status, stage_upload
 from dependencies.store import is_user_owner_or_stuff
-from schemas.pagination import PaginationSchema
-from dependencies.auth import get_current_user
-from crud.categories import crud_subcategory, crud_category
-from schemas.users import UserDataSchema
+from schemas.pagination import CursorPaginationSchema, PaginationSchema
+from services.pagination import decode_cursor, encode_cursor
+from dependencies.auth import get_current_principal, get_current_user
+from services.category_registry import category_registry
+from schemas.users import PrincipalSchema, UserDataSchema
 from crud.posts import crud_postimage, crud_post
 from dependencies.db import get_async_session
 from models.users import Users
 from schemas.posts import (
     PostCreateInSchema,
-    PostImageUpdate,
+    PostImageInfo,
+    PostImagesOrderSchema,
     PostUpdateSchema,
 )
+from models.posts import PostImage
+from services.images import release_images
+from utils.images import stored_image_url
 from sqlalchemy.ext.asyncio import AsyncSession
 from schemas.posts import PostInfoSchema
 from dependencies.users import is_user_activated
-from fastapi_cache.decorator import cache
+from services.cache import add_cache_tags, cached_response, model_cache_tags
 from starlette.requests import Request
 from starlette.responses import Response
 
@@ -56,8 +64,10 @@ async def create_post_handler(
     # Validate and transform category and subcategory
     try:
         # Fetch category and subcategory objects based on provided strings
-        category = await crud_category.get(db, title=post_data.category)
-        subcategory = await crud_subcategory.get(db, title=post_data.subcategory)
+        category = await category_registry.get_category(db, title=post_data.category)
+        subcategory = await category_registry.get_subcategory(
+            db, title=post_data.subcategory
+        )
 
         # Validate post creation data
         await validate_post_create_data(post_data, category, subcategory)
@@ -103,14 +113,15 @@ async def create_post_handler(
         )
 
 
-@cache(expire=60)
 @router.get("/all", response_model=PaginationSchema[PostInfoSchema])
+@cached_response("posts:list")
 async def get_posts(
-    offset: int = Query(default=0),
-    limit: int = Query(default=2),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=2, ge=1, le=100),
     order_by: str = None,
     id: str = None,
     title: str = None,
+    search: str = None,
     category_title: str = None,
     subcategory_title: str = None,
     owner_username: str = None,
@@ -119,6 +130,7 @@ async def get_posts(
     is_vip: Optional[bool] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
+    count: Literal["exact", "estimated", "cached", "none"] = "exact",
     detail: str = "ok",
     request: Request = None,
     response: Response = None,
@@ -136,10 +148,11 @@ async def get_posts(
             owner = await validate_owner(db, username=owner_username)
             owner_id = owner.id
 
-        posts, total = await crud_post.get_multi_filtered(
-            db,
+        filters = dict(
             offset=offset,
-            limit=limit,
+            # With the "none" count strategy fetch one extra post to detect a next page
+            limit=limit + 1 if count == "none" else limit,
+            count_strategy=count,
             is_vip=is_vip,
             min_price=min_price,
             max_price=max_price,
@@ -150,15 +163,37 @@ async def get_posts(
             owner=owner_id,
             created_start_date=created_start_date,
             created_end_date=created_end_date,
-            order_by=order_by,
         )
 
-        result_posts = [
-            await prepare_post_data_for_response(db, post) for post in posts
-        ]
+        if search:
+            # Ranked full-text search over titles and descriptions
+            posts, total = await crud_post.search(db, search, **filters)
+        else:
+            posts, total = await crud_post.get_multi_filtered(
+                db, order_by=order_by, **filters
+            )
+
+        has_more = None
+        if count == "none":
+            has_more = len(posts) > limit
+            posts = posts[:limit]
+
+        # Any post write can change a listing, post tags catch owner/category changes
+        add_cache_tags(
+            request,
+            "posts",
+            *[tag for post in posts for tag in model_cache_tags(post, include_table=False)],
+        )
+
+        result_posts = await prepare_posts_data_for_response(db, posts)
 
         return PaginationSchema[PostInfoSchema](
-            total=total, items=result_posts, offset=offset, limit=limit, detail=detail
+            total=total,
+            has_more=has_more,
+            items=result_posts,
+            offset=offset,
+            limit=limit,
+            detail=detail,
         )
 
     except HTTPException as e:
@@ -171,8 +206,8 @@ async def get_posts(
         )
 
 
-@cache(expire=60)
 @router.get("/id/{id}", response_model=PostInfoSchema)
+@cached_response("posts:detail")
 async def get_post(
     id: str,
     request: Request = None,
@@ -184,6 +219,8 @@ async def get_post(
         if not post:
             raise HTTPException(status_code=404, detail="Post not found")
 
+        add_cache_tags(request, *model_cache_tags(post, include_table=False))
+
         post_data = await prepare_post_data_for_response(db, post, include_images=True)
 
         return PostInfoSchema(**post_data)
@@ -199,12 +236,12 @@ async def get_post(
         )
 
 
-@cache(expire=60)
 @router.get("/user/{username}/all", response_model=PaginationSchema[PostInfoSchema])
+@cached_response("posts:list")
 async def get_posts_by_username(
     username: str,
-    offset: int = Query(default=0),
-    limit: int = Query(default=2),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=2, ge=1, le=100),
     order_by: str = None,
     id: str = None,
     category_title: str = None,
@@ -214,6 +251,7 @@ async def get_posts_by_username(
     is_vip: Optional[bool] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
+    count: Literal["exact", "estimated", "cached", "none"] = "exact",
     detail: str = "ok",
     request: Request = None,
     response: Response = None,
@@ -232,7 +270,9 @@ async def get_posts_by_username(
         posts, total = await crud_post.get_multi_filtered(
             db,
             offset=offset,
-            limit=limit,
+            # With the "none" count strategy fetch one extra post to detect a next page
+            limit=limit + 1 if count == "none" else limit,
+            count_strategy=count,
             is_vip=is_vip,
             min_price=min_price,
             max_price=max_price,
@@ -244,12 +284,27 @@ async def get_posts_by_username(
             created_end_date=created_end_date,
             order_by=order_by,
         )
-        result_posts = [
-            await prepare_post_data_for_response(db, post) for post in posts
-        ]
+        has_more = None
+        if count == "none":
+            has_more = len(posts) > limit
+            posts = posts[:limit]
+
+        # Any post write can change a listing, post tags catch owner/category changes
+        add_cache_tags(
+            request,
+            "posts",
+            *[tag for post in posts for tag in model_cache_tags(post, include_table=False)],
+        )
+
+        result_posts = await prepare_posts_data_for_response(db, posts)
 
         return PaginationSchema[PostInfoSchema](
-            total=total, items=result_posts, offset=offset, limit=limit, detail=detail
+            total=total,
+            has_more=has_more,
+            items=result_posts,
+            offset=offset,
+            limit=limit,
+            detail=detail,
         )
 
     except HTTPException as e:
@@ -262,11 +317,160 @@ async def get_posts_by_username(
         )
 
 
+@router.get("/all/cursor", response_model=CursorPaginationSchema[PostInfoSchema])
+@cached_response("posts:list")
+async def get_posts_by_cursor(
+    cursor: Optional[str] = None,
+    limit: int = Query(default=2, ge=1, le=100),
+    order_by: str = None,
+    title: str = None,
+    category_title: str = None,
+    subcategory_title: str = None,
+    owner_username: str = None,
+    created_start_date: Optional[date] = None,
+    created_end_date: Optional[date] = None,
+    is_vip: Optional[bool] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    detail: str = "ok",
+    request: Request = None,
+    db: AsyncSession = Depends(get_async_session),
+) -> CursorPaginationSchema[PostInfoSchema]:
+    """
+    Same listing as /all, paginated with an opaque cursor instead of offset.
+    Pass `next_cursor` of the previous response to get the next page.
+    """
+    try:
+        category, subcategory = None, None
+        if category_title and subcategory_title:
+            category, subcategory = await validate_and_transform_category_subcategory(
+                db, category_title, subcategory_title
+            )
+
+        owner_id = None
+        if owner_username:
+            owner = await validate_owner(db, username=owner_username)
+            owner_id = owner.id
+
+        posts, next_key = await crud_post.get_multi_keyset(
+            db,
+            cursor=decode_cursor(cursor, order_by, crud_post.keyset_types(order_by)) if cursor else None,
+            limit=limit,
+            is_vip=is_vip,
+            min_price=min_price,
+            max_price=max_price,
+            title=title,
+            category=category.id if category else None,
+            subcategory=subcategory.id if subcategory else None,
+            owner=owner_id,
+            created_start_date=created_start_date,
+            created_end_date=created_end_date,
+            order_by=order_by,
+        )
+
+        # Any post write can change a listing, post tags catch owner/category changes
+        add_cache_tags(
+            request,
+            "posts",
+            *[tag for post in posts for tag in model_cache_tags(post, include_table=False)],
+        )
+
+        result_posts = await prepare_posts_data_for_response(db, posts)
+
+        return CursorPaginationSchema[PostInfoSchema](
+            items=result_posts,
+            next_cursor=encode_cursor(next_key, order_by) if next_key else None,
+            limit=limit,
+            detail=detail,
+        )
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logging.error(f"getting posts by cursor error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error occurred during getting posts",
+        )
+
+
+@router.get(
+    "/user/{username}/all/cursor",
+    response_model=CursorPaginationSchema[PostInfoSchema],
+)
+@cached_response("posts:list")
+async def get_posts_by_username_by_cursor(
+    username: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=2, ge=1, le=100),
+    order_by: str = None,
+    category_title: str = None,
+    subcategory_title: str = None,
+    created_start_date: Optional[date] = None,
+    created_end_date: Optional[date] = None,
+    is_vip: Optional[bool] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    detail: str = "ok",
+    request: Request = None,
+    db: AsyncSession = Depends(get_async_session),
+) -> CursorPaginationSchema[PostInfoSchema]:
+
+    try:
+        owner = await validate_owner(db, username=username)
+
+        category, subcategory = None, None
+        if category_title and subcategory_title:
+            category, subcategory = await validate_and_transform_category_subcategory(
+                db, category_title, subcategory_title
+            )
+
+        posts, next_key = await crud_post.get_multi_keyset(
+            db,
+            cursor=decode_cursor(cursor, order_by, crud_post.keyset_types(order_by)) if cursor else None,
+            limit=limit,
+            is_vip=is_vip,
+            min_price=min_price,
+            max_price=max_price,
+            category=category.id if category else None,
+            subcategory=subcategory.id if subcategory else None,
+            owner=owner.id,
+            created_start_date=created_start_date,
+            created_end_date=created_end_date,
+            order_by=order_by,
+        )
+
+        # Any post write can change a listing, post tags catch owner/category changes
+        add_cache_tags(
+            request,
+            "posts",
+            *[tag for post in posts for tag in model_cache_tags(post, include_table=False)],
+        )
+
+        result_posts = await prepare_posts_data_for_response(db, posts)
+
+        return CursorPaginationSchema[PostInfoSchema](
+            items=result_posts,
+            next_cursor=encode_cursor(next_key, order_by) if next_key else None,
+            limit=limit,
+            detail=detail,
+        )
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logging.error(f"getting user's posts by cursor error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error occurred during getting user's posts",
+        )
+
+
 @router.put("/update/{post_id}", response_model=PostInfoSchema)
 async def update_post_info(
     post_id: str,
     post_data: PostUpdateSchema,
-    user: Users = Depends(get_current_user),
+    user: PrincipalSchema = Depends(get_current_principal),
     db: AsyncSession = Depends(get_async_session),
 ):
 
@@ -319,10 +523,14 @@ async def update_post_info(
         )
 
 
-@router.post("/{post_id}/upload-photo", dependencies=[Depends(is_user_owner_or_stuff)])
+@router.post(
+    "/{post_id}/upload-photo",
+    dependencies=[Depends(is_user_owner_or_stuff)],
+    status_code=status.HTTP_202_ACCEPTED,
+)
 async def upload_post_photo(
     post_id: str,
-    user: Users = Depends(get_current_user),
+    user: PrincipalSchema = Depends(get_current_principal),
     files: List[UploadFile] = File(...),
     db: AsyncSession = Depends(get_async_session),
 ):
@@ -334,77 +542,227 @@ async def upload_post_photo(
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
+    staged = []
     try:
+        # Stage and validate every file before touching the existing images
+        for file in files:
+            staged.append(await stage_upload(file))
+
+        # Uploads whose content is already an image of the post keep that
+        # image, it's at most moved to its new position
+        unchanged = defaultdict(list)
+        for image in await crud_postimage.get_post_images(db, post_id):
+            unchanged[image.image].append(image)
+
+        kept_positions, kept_paths, new_staged, new_positions = {}, [], [], []
+        for position, (staged_path, content_hash) in enumerate(staged):
+            kept = unchanged[stored_image_url(content_hash)]
+            if kept:
+                kept_positions[kept.pop(0).id] = position
+                kept_paths.append(staged_path)
+            else:
+                new_staged.append((staged_path, content_hash))
+                new_positions.append(position)
+        await discard_staged_uploads(kept_paths)
+        staged = new_staged
+
+        # The other images are replaced, their rows go in one statement and
+        # their files are removed by a worker
+        removed_ids = [image.id for images in unchanged.values() for image in images]
+        if removed_ids:
+            removed = await crud_postimage.delete_multi(db, PostImage.id.in_(removed_ids))
+            await release_images(db, [image.image for image in removed])
+
+        await crud_postimage.set_positions(db, post_id, kept_positions)
+        jobs = await attach_post_images(db, post_id, staged, new_positions)
+
+        return {
+            "detail": "images are being processed",
+            "images": [
+                post_image_info(image) for image in await crud_postimage.get_post_images(db, post_id)
+            ],
+            "jobs": jobs,
+        }
+
+    except HTTPException as e:
+        await discard_staged_uploads([staged_path for staged_path, _ in staged])
+        raise e
+
+    except Exception as e:
+        await discard_staged_uploads([staged_path for staged_path, _ in staged])
+        await db.rollback()  # Rollback in case of any exception
+        logging.error(f"File upload error: {e}", exc_info=True)
+        raise HTTPException(
+            detail="Internal server error occurred during uploading image",
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+
+@router.post(
+    "/{post_id}/images",
+    dependencies=[Depends(is_user_owner_or_stuff)],
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def add_post_images(
+    post_id: str,
+    user: PrincipalSchema = Depends(get_current_principal),
+    files: List[UploadFile] = File(...),
+    db: AsyncSession = Depends(get_async_session),
+):
+    """
+    Append images to a post, its current images are left as they are.
+    """
+    upload_limit = VIPS_POST_IMAGES_LIMIT if user.is_vip else POST_IMAGES_LIMIT
+    existing_images = await crud_postimage.get_post_images(db, post_id)
+    if len(existing_images) + len(files) > upload_limit:
+        raise HTTPException(
+            detail=f"Image limit exceeded, a post can have up to {upload_limit} images",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
 
-        # Check if the number of files exceeds the limit
-        existing_images = await crud_postimage.get_multi(db=db, post=post_id)
-
-        # If there are existing images, delete them from the database and the folder
-        if existing_images:
-            for image in existing_images:
-                # Delete the file from the filesystem
-                actual_file_name = image.image.split("/")[-1]
-                file_path = os.path.join(POSTS_PICTURES_DIR, actual_file_name)
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                # Delete the record from the database
-                await crud_postimage.delete(db=db, id=image.id)
-
-        # Process each file
+    staged = []
+    try:
         for file in files:
-            # Read the file content
-            file_content = await file.read()
-            filename = file.filename
+            staged.append(await stage_upload(file))
+
+        first_position = await crud_postimage.next_position(db, post_id)
+        jobs = await attach_post_images(
+            db, post_id, staged, list(range(first_position, first_position + len(staged)))
+        )
+
+        return {
+            "detail": "images are being processed",
+            "images": [
+                post_image_info(image) for image in await crud_postimage.get_post_images(db, post_id)
+            ],
+            "jobs": jobs,
+        }
 
-            # Asynchronously upload the picture and wait for the result
-            task_result = upload_picture.delay(
-                file_content, filename, POSTS_PICTURES_DIR
+    except HTTPException as e:
+        await discard_staged_uploads([staged_path for staged_path, _ in staged])
+        raise e
+
+    except Exception as e:
+        await discard_staged_uploads([staged_path for staged_path, _ in staged])
+        await db.rollback()
+        logging.error(f"Adding post images error: {e}", exc_info=True)
+        raise HTTPException(
+            detail="Internal server error occurred during uploading image",
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+
+@router.delete("/{post_id}/images", dependencies=[Depends(is_user_owner_or_stuff)])
+async def remove_post_images(
+    post_id: str,
+    ids: List[uuid.UUID] = Query(..., description="Ids of the images to remove"),
+    db: AsyncSession = Depends(get_async_session),
+):
+    """
+    Remove some images of a post, the other ones keep their positions.
+    """
+    try:
+        removed = await crud_postimage.delete_multi(db, PostImage.id.in_(ids), post=post_id)
+        if not removed:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Images not found"
             )
-            file_url = task_result.get(timeout=10)
+        await release_images(db, [image.image for image in removed])
 
-            # Create new PostImage object with 'images' as a list of URLs
-            post_image_in = PostImageUpdate(
-                post=post_id, image=file_url
-            )  # Corrected here
-            new_post_image = await crud_postimage.create(db, obj_in=post_image_in)
+        return {
+            "detail": "Images removed successfully.",
+            "removed": [image.id for image in removed],
+        }
 
-            # Confirm new_post_image is not None and is persisted successfully
-            if not new_post_image:
-                raise HTTPException(
-                    detail="Failed to save image information to the database",
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
+    except HTTPException as e:
+        raise e
 
-        await db.commit()  # Make sure to commit after all changes
+    except Exception as e:
+        await db.rollback()
+        logging.error(f"Removing post images error: {e}", exc_info=True)
+        raise HTTPException(
+            detail="Internal server error occurred during removing images",
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
 
-        return {"detail": "images were saved"}
+
+@router.put(
+    "/{post_id}/images/order",
+    response_model=List[PostImageInfo],
+    dependencies=[Depends(is_user_owner_or_stuff)],
+)
+async def reorder_post_images(
+    post_id: str,
+    order: PostImagesOrderSchema,
+    db: AsyncSession = Depends(get_async_session),
+):
+    """
+    Reorder the images of a post, only the images that move are written.
+    """
+    try:
+        images = await crud_postimage.get_post_images(db, post_id)
+        if len(order.ids) != len(images) or set(order.ids) != {image.id for image in images}:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="ids must list every image of the post exactly once",
+            )
+
+        await crud_postimage.set_positions(
+            db, post_id, {image_id: position for position, image_id in enumerate(order.ids)}
+        )
+
+        return [
+            post_image_info(image) for image in await crud_postimage.get_post_images(db, post_id)
+        ]
+
+    except HTTPException as e:
+        raise e
 
     except Exception as e:
-        await db.rollback()  # Rollback in case of any exception
-        logging.error(f"File upload error: {e}", exc_info=True)
+        await db.rollback()
+        logging.error(f"Reordering post images error: {e}", exc_info=True)
         raise HTTPException(
-            detail="Internal server error occurred during uploading image",
+            detail="Internal server error occurred during reordering images",
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
 
 
+@router.get("/upload-jobs/{job_id}")
+async def get_upload_job(job_id: str) -> dict:
+    """
+    Processing status of an image uploaded with /{post_id}/upload-photo.
+    """
+    return await get_upload_job_status(job_id)
+
+
 @router.post("/delete/{post_id}", dependencies=[Depends(is_user_owner_or_stuff)])
-async def upload_post_photo(
+async def delete_post(
     post_id: str,
-    user: Users = Depends(get_current_user),
+    user: PrincipalSchema = Depends(get_current_principal),
     db: AsyncSession = Depends(get_async_session),
 ):
 
     try:
-        post = await crud_post.get(id=post_id)
-        # Check if the number of files exceeds the limit
+        post = await crud_post.get(db, id=post_id)
+        if post is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Post not found"
+            )
+
+        # Images are deleted before the post, so their stored files get released
+        images = await crud_postimage.delete_multi(db, post=post_id)
         await crud_post.delete(db, db_obj=post)
+        if images:
+            await release_images(db, [image.image for image in images])
         return {"detail": "Post deleted successfully."}
 
+    except HTTPException as e:
+        raise e
+
     except Exception as e:
         await db.rollback()  # Rollback in case of any exception
-        logging.error(f"File upload error: {e}", exc_info=True)
+        logging.error(f"Post deleting error: {e}", exc_info=True)
         raise HTTPException(
-            detail="Internal server error occurred during uploading image",
+            detail="Internal server error occurred during deleting post",
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
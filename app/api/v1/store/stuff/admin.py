@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from crud.users import crud_user
 from crud.store import crud_report
 from services.admin import generate_report
+from services.cache import get_cache_stats
 from schemas.admin import DailyReportScheme,  AdminBugsClosedCountSchema
 from schemas.store import BugReportInfoSchema
 from dependencies.users import is_user_stuff
@@ -58,3 +59,11 @@ async def admin_bug_counts(db: AsyncSession = Depends(get_async_session)):
         # No need for else, as all users are already initialized with 0
 
     return result
+
+
+@router.get("/cache-stats", response_model=dict, dependencies=[Depends(is_user_stuff)])
+async def cache_stats() -> dict:
+    """
+    Response cache hit/miss counters of the current worker process.
+    """
+    return get_cache_stats()
@@ -1,6 +1,5 @@
 from datetime import datetime
 import logging
-from fastapi_cache.decorator import cache
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.requests import Request
@@ -10,12 +9,12 @@ from models.store import BugReportComment
 from dependencies.users import is_user_stuff
 from schemas.pagination import PaginationSchema
 from crud.users import crud_user
-from schemas.users import UserDataSchema
+from schemas.users import PrincipalSchema, UserDataSchema
 from schemas.store import BugCommentInfoScheme, BugCommentScheme, BugReportCreateSchema, BugReportInfoSchema
 from dependencies.db import get_async_session
-from dependencies.auth import get_current_user
-from models.users import Users
+from dependencies.auth import get_current_principal
 from crud.store import crud_report, crud_comments
+from services.cache import add_cache_tags, cached_response, model_cache_tags
 
 router = APIRouter(
     prefix="/reports",
@@ -25,7 +24,7 @@ router = APIRouter(
 @router.post("/create")
 async def create_report(
     report_data: BugReportCreateSchema,
-    user: Users = Depends(get_current_user),
+    user: PrincipalSchema = Depends(get_current_principal),
     db: AsyncSession = Depends(get_async_session),
 ) -> dict:
     try:
@@ -55,12 +54,12 @@ async def create_report(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error occurred during bug report creation.",
         )
-@cache(expire=60)
 @router.get(
     "/all",
     dependencies=[Depends(is_user_stuff)],
     response_model=PaginationSchema[BugReportInfoSchema],
 )
+@cached_response("reports:list", vary_on_principal=True)
 async def get_reports(
     request: Request,
     response: Response,
@@ -78,6 +77,12 @@ async def get_reports(
             activated_field_name="is_closed",
         )
 
+        add_cache_tags(
+            request,
+            "bugreports",
+            *[tag for report in reports for tag in model_cache_tags(report, include_table=False)],
+        )
+
         for report in reports:
             report_data = report.dict()
             
@@ -115,7 +120,7 @@ async def get_reports(
     dependencies=[Depends(is_user_stuff)],
 )
 async def close_report(id: int, db: AsyncSession = Depends(get_async_session),
-                                current_user: Users = Depends(get_current_user)) -> dict:
+                                current_user: PrincipalSchema = Depends(get_current_principal)) -> dict:
     try:
         report = await crud_report.update(db, id=id, obj_in={"is_closed": True, 
                                                             "closed_by_id": current_user.id})
@@ -135,12 +140,12 @@ async def close_report(id: int, db: AsyncSession = Depends(get_async_session),
         )
 
 
-@cache(expire=60)
 @router.get(
     "/id/{report_id}",
     dependencies=[Depends(is_user_stuff)],
     response_model=BugReportInfoSchema,
 )
+@cached_response("reports:detail", vary_on_principal=True)
 async def get_report_by_id(
     request: Request,
     response: Response,
@@ -154,6 +159,8 @@ async def get_report_by_id(
         if not report:
             raise HTTPException(status_code=404, detail="Report not found")
 
+        add_cache_tags(request, *model_cache_tags(report, include_table=False))
+
         report_data = report.dict()
 
         # Fetch user using the correct attribute (user_id)
@@ -183,7 +190,12 @@ async def get_report_by_id(
 
 
 @router.post("/id/{bug_id}/create-comment", response_model=BugCommentInfoScheme, dependencies=[Depends(is_user_stuff)])
-async def add_comment_to_bug(bug_id: int, comment_data: BugCommentScheme, user: Users = Depends(get_current_user), db: AsyncSession = Depends(get_async_session)):
+async def add_comment_to_bug(
+    bug_id: int,
+    comment_data: BugCommentScheme,
+    user: PrincipalSchema = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_session),
+):
     # Ensure the bug exists
     try:
         bug = await crud_report.get(db, id=bug_id)
@@ -5,13 +5,14 @@ from schemas.tokens import RefreshTokenRequestSchema, TokenSchema
 from schemas.email import ForgotPasswordEmailSchema
 from dependencies.auth import get_current_user
 from services.tokens import (
-    blacklist_token,
     create_jwt_tokens,
-    is_token_blacklisted,
+    is_token_revoked,
+    revoke_token,
     verify_token,
 )
 from sqlalchemy.exc import SQLAlchemyError
 from services.email import reset_email_sender, verify_email_sender
+from services.outbox import dispatch_queued_emails, queue_email
 from dependencies.db import get_async_session
 from schemas.users import (
     UserCreateInSchema,
@@ -20,11 +21,15 @@ from schemas.users import (
     UserPasswordResetSchema,
 )
 from services.auth import get_password_hash, verify_password, verify_user_credentials
-from services.validators import is_unique, validate_password, validate_email
+from services.validators import get_conflicting_fields, validate_password, validate_email
 from models.users import Users
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from crud.users import crud_user
+from crud.posts import crud_postimage
+from models.posts import Post, PostImage
+from services.images import release_images
+from sqlalchemy import select
 
 
 router = APIRouter(
@@ -53,31 +58,35 @@ async def create_user(
         if await validate_password(user_request.password) and await validate_email(
             user_request.email
         ):
-            if await is_unique(
-                db,
-                Users,
-                {"email": user_request.email, "username": user_request.username},
-            ):
-
-                # Hash password and create user
-                user_request.password = get_password_hash(user_request.password)
-                obj_in = UserCreateInSchema(**user_request.dict())
-                new_user = await crud_user.create(
-                    db, obj_in
-                )  # This should return the new user object with an ID
-
-                await verify_email_sender.send_email(
-                    [new_user.email], request, "send-verification.html"
+            # Hash password and create user, the unique indexes decide whether
+            # the username and email are free
+            user_request.password = await get_password_hash(user_request.password)
+            obj_in = UserCreateInSchema(**user_request.dict())
+            new_user = await crud_user.create_if_unique(db, obj_in, commit=False)
+            if new_user is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=await get_conflicting_fields(
+                        db,
+                        Users,
+                        {"email": user_request.email, "username": user_request.username},
+                    )
+                    or "This username or email is already in use.",
                 )
 
-                # Generate tokens using the new_user object, which has an 'id'
-                tokens = await create_jwt_tokens(
-                    new_user
-                )  # Pass new_user instead of user_request
+            # The user and its verification email are committed together
+            await queue_email(db, verify_email_sender, new_user, request)
+            await db.commit()
+            await dispatch_queued_emails()
+
+            # Generate tokens using the new_user object, which has an 'id'
+            tokens = await create_jwt_tokens(
+                new_user
+            )  # Pass new_user instead of user_request
 
-                # Prepare the output data
-                # Ensure you are returning a structure that includes the new_user data and tokens correctly
-                return UserCreateOutSchema(**new_user.dict(), tokens=tokens)  # Adjust
+            # Prepare the output data
+            # Ensure you are returning a structure that includes the new_user data and tokens correctly
+            return UserCreateOutSchema(**new_user.dict(), tokens=tokens)  # Adjust
     except HTTPException as e:
         raise e
 
@@ -159,7 +168,7 @@ async def change_password(
 ):
 
     try:
-        if not verify_password(user_request.old_password, user.password):
+        if not await verify_password(user_request.old_password, user.password):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Old password is incorrect.",
@@ -178,7 +187,7 @@ async def change_password(
             )
 
         # Hash new password before saving
-        new_password = get_password_hash(user_request.new_password1)
+        new_password = await get_password_hash(user_request.new_password1)
 
         user = await crud_user.update(
             db, db_obj=user, obj_in={"password": new_password}
@@ -205,10 +214,9 @@ async def refresh_token(
 ):
     try:
         refresh_token = refresh_token_request.token
-        if await is_token_blacklisted(refresh_token, db):
-            raise HTTPException(status_code=400, detail="Token is blacklisted")
-
         payload = await verify_token(refresh_token, "refresh_token")
+        if await is_token_revoked(payload, db):
+            raise HTTPException(status_code=400, detail="Token is blacklisted")
 
         # Assuming you have a method to retrieve a Users object by id
         user = await crud_user.get(db, id=payload.user_id)
@@ -216,7 +224,7 @@ async def refresh_token(
         tokens = await create_jwt_tokens(
             user
         )  # Pass the user object to create new tokens
-        await blacklist_token(refresh_token, db)
+        await revoke_token(payload, db)
         return tokens
 
     except HTTPException as e:
@@ -238,17 +246,15 @@ async def forgot_password(
 ):
     try:
         identifier = identifier.identifier
-        user = await crud_user.get(db, username=identifier)
-        if not user:
-            user = await crud_user.get(db, email=identifier)
+        user = await crud_user.get_by_login(db, identifier)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Incorrect username or email",
             )
-        await reset_email_sender.send_email(
-            [user.email], request, "password-reset.html"
-        )
+        await queue_email(db, reset_email_sender, user, request)
+        await db.commit()
+        await dispatch_queued_emails()
 
         return {"detail": "email was sent"}
 
@@ -272,14 +278,13 @@ async def rest_email_verification(
     try:
         token = token.strip()
 
-        if await is_token_blacklisted(token, db):
+        token_data = await verify_token(token, "access")
+        if await is_token_revoked(token_data, db):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token is expired or invalid",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-
-        token_data = await verify_token(token, "access")
         user_id = str(token_data.user_id)
 
         user = await crud_user.get(db, id=user_id)
@@ -298,13 +303,13 @@ async def rest_email_verification(
                     detail="Two passwords didn't match",
                 )
 
-            new_password = get_password_hash(user_request.new_password1)
+            new_password = await get_password_hash(user_request.new_password1)
 
             user = await crud_user.update(
                 db, db_obj=user, obj_in={"password": new_password}
             )
 
-            await blacklist_token(token, db)
+            await revoke_token(token_data, db)
 
             token_schema = await create_jwt_tokens(user)
             return token_schema
@@ -331,7 +336,13 @@ async def delete_account(
     db: AsyncSession = Depends(get_async_session),
 ):
     try:
+        # Post images are deleted ahead of the cascade, so their stored files get released
+        images = await crud_postimage.delete_multi(
+            db, PostImage.post.in_(select(Post.id).where(Post.owner == user.id))
+        )
+        avatar = user.image
         await crud_user.delete(db, db_obj=user)
+        await release_images(db, [image.image for image in images] + [avatar])
         return {"detail": "User deleted successfully."}
     except SQLAlchemyError as e:
         logging.error(f"Verification error: {e}")
@@ -358,12 +369,16 @@ async def logout():
 
 
 @router.post("/send-verification", dependencies=[Depends(is_user_not_activated)])
-async def send_verification_email(request:Request, user:Users = Depends(get_current_user)):
+async def send_verification_email(
+    request: Request,
+    user: Users = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session),
+):
     
     try:
-        await verify_email_sender.send_email(
-                    [user.email], request, "send-verification.html"
-                )
+        await queue_email(db, verify_email_sender, user, request)
+        await db.commit()
+        await dispatch_queued_emails()
     
         return {"detail": "email was sent"}
     
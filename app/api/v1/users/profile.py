@@ -1,7 +1,11 @@
 import logging
 from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
-from configs.general import AVATARS_DIR
-from tasks.store import upload_picture
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from crud.images import crud_stored_image
+from services.images import release_images, store_staged_image
+from tasks.store import process_avatar_picture
+from utils.uploads import discard_staged_uploads, get_upload_job_status, stage_upload
 from schemas.users import UserDataSchema
 from models.users import Users
 from dependencies.db import get_async_session
@@ -33,8 +37,9 @@ async def get_user_info(
     return user
 
 
-@router.put("/update-image")
+@router.put("/update-image", status_code=status.HTTP_202_ACCEPTED)
 async def update_photo(
+    response: Response,
     file: UploadFile = File(...),
     user: Users = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_session),
@@ -42,20 +47,43 @@ async def update_photo(
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    file_content = await file.read()
-    filename = file.filename
+    staged_path = None
+    try:
+        staged_path, content_hash = await stage_upload(file)
 
-    # Call the task with file content and filename
-    task_result = upload_picture.delay(file_content, filename, AVATARS_DIR)
-    file_url = task_result.get(timeout=10)
+        # Already stored content is only referenced again, no processing needed
+        if await crud_stored_image.get(db, hash=content_hash):
+            previous_image = user.image
+            file_url = await store_staged_image(db, staged_path, content_hash)
+            await crud_user.update(db, db_obj=user, obj_in={"image": file_url})
+            await release_images(db, [previous_image])
 
-    try:
-        await crud_user.update(db, db_obj=user, obj_in={"image": file_url})
-        return {"detail": "Image uploaded successfully.", "image": file_url}
+            response.status_code = status.HTTP_200_OK
+            return {"detail": "Image uploaded successfully.", "image": file_url}
+
+        # The worker updates the user's image once it's processed
+        task = await run_in_threadpool(
+            process_avatar_picture.delay, staged_path, content_hash, str(user.id)
+        )
+        return {"detail": "Image is being processed.", "job": task.id}
+
+    except HTTPException as e:
+        raise e
 
     except Exception as e:
-        logging.error(f"Verification error: {e}")
+        # Also when the task couldn't be queued, nothing would process the upload
+        if staged_path is not None:
+            await discard_staged_uploads([staged_path])
+        logging.error(f"Avatar upload error: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Internal server error occurred during email verification",
+            detail="Internal server error occurred during uploading image",
         )
+
+
+@router.get("/update-image/jobs/{job_id}")
+async def get_update_photo_job(job_id: str) -> dict:
+    """
+    Processing status of an image uploaded with /update-image.
+    """
+    return await get_upload_job_status(job_id)
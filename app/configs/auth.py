@@ -11,3 +11,22 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES'))
 REFRESH_TOKEN_EXPIRE_MINUTES = int(os.getenv('REFRESH_TOKEN_EXPIRE_MINUTES'))
 
 REFRESH_TOKEN_EXPIRE_DAYS = REFRESH_TOKEN_EXPIRE_MINUTES * 24 * 7  
+
+# Authenticated principals are cached per process for PRINCIPAL_CACHE_TTL seconds,
+# PRINCIPAL_CACHE_REDIS adds redis as a second level shared by every process
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", 60))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", 10000))
+PRINCIPAL_CACHE_REDIS = os.getenv("PRINCIPAL_CACHE_REDIS", "false").lower() in ("1", "true", "yes")
+
+# In-process bloom filter of revoked token ids, a miss means "not revoked" without a round trip.
+# It's rebuilt every TOKEN_REVOCATION_BLOOM_REBUILD seconds to forget expired tokens.
+TOKEN_REVOCATION_BLOOM_BITS = int(os.getenv("TOKEN_REVOCATION_BLOOM_BITS", 8 * 1024 * 1024))
+TOKEN_REVOCATION_BLOOM_HASHES = int(os.getenv("TOKEN_REVOCATION_BLOOM_HASHES", 5))
+TOKEN_REVOCATION_BLOOM_REBUILD = int(os.getenv("TOKEN_REVOCATION_BLOOM_REBUILD", 6 * 60 * 60))
+
+# bcrypt cost factor, hashes made with another cost are rehashed on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Password hashing runs in a thread pool off the event loop, PASSWORD_HASHING_QUEUE_LIMIT
+# operations may be running or waiting per process before requests get a 503
+PASSWORD_HASHING_WORKERS = int(os.getenv("PASSWORD_HASHING_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_HASHING_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASHING_QUEUE_LIMIT", 32))
@@ -0,0 +1,17 @@
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+RESPONSE_CACHE_PREFIX = os.getenv("RESPONSE_CACHE_PREFIX", "response-cache")
+
+RESPONSE_CACHE_DEFAULT_TTL = int(os.getenv("RESPONSE_CACHE_DEFAULT_TTL", 3600))
+
+# Per route cache lifetime in seconds, keyed by the cache namespace of the route.
+# Entries are invalidated by tags on writes, so lifetimes can be long.
+RESPONSE_CACHE_TTLS = {
+    "posts:list": int(os.getenv("CACHE_TTL_POSTS_LIST", 3600)),
+    "posts:detail": int(os.getenv("CACHE_TTL_POSTS_DETAIL", 3600)),
+    "reports:list": int(os.getenv("CACHE_TTL_REPORTS_LIST", 3600)),
+    "reports:detail": int(os.getenv("CACHE_TTL_REPORTS_DETAIL", 3600)),
+}
@@ -13,3 +13,8 @@ REDIS_HOST = os.getenv("REDIS_HOST")
 REDIS_PORT = os.getenv("REDIS_PORT")
 
 REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}"
+
+# Celery worker processes, each has its own engine created after the fork
+CELERY_DB_ECHO = os.getenv("CELERY_DB_ECHO", "false").lower() in ("1", "true", "yes")
+# Connections a worker process opens on top of the one its running task uses
+CELERY_DB_MAX_OVERFLOW = int(os.getenv("CELERY_DB_MAX_OVERFLOW", 4))
@@ -8,3 +8,39 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 
 EMAIL_HOST_USERNAME = os.getenv("EMAIL_HOST_USERNAME")
+
+# Queued emails sent per dispatcher run
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", 50))
+
+# Failed sends are retried after EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+# seconds, at most EMAIL_OUTBOX_MAX_RETRY_DELAY, until EMAIL_OUTBOX_MAX_ATTEMPTS
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", 8))
+
+EMAIL_OUTBOX_RETRY_DELAY = int(os.getenv("EMAIL_OUTBOX_RETRY_DELAY", 30))
+
+EMAIL_OUTBOX_MAX_RETRY_DELAY = int(os.getenv("EMAIL_OUTBOX_MAX_RETRY_DELAY", 3600))
+
+# Days sent and failed emails are kept in the outbox before being purged
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", 7))
+
+# Seconds between beat runs of the dispatcher, emails are also dispatched right after being queued
+EMAIL_OUTBOX_DISPATCH_INTERVAL = int(os.getenv("EMAIL_OUTBOX_DISPATCH_INTERVAL", 30))
+
+# SMTP server the emails are sent through
+EMAIL_SMTP_SERVER = os.getenv("EMAIL_SMTP_SERVER", "smtp.gmail.com")
+
+EMAIL_SMTP_PORT = int(os.getenv("EMAIL_SMTP_PORT", 587))
+
+EMAIL_SMTP_STARTTLS = os.getenv("EMAIL_SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+
+EMAIL_SMTP_SSL = os.getenv("EMAIL_SMTP_SSL", "false").lower() in ("1", "true", "yes")
+
+EMAIL_SMTP_VALIDATE_CERTS = os.getenv("EMAIL_SMTP_VALIDATE_CERTS", "true").lower() in ("1", "true", "yes")
+
+EMAIL_SMTP_TIMEOUT = int(os.getenv("EMAIL_SMTP_TIMEOUT", 30))
+
+# Authenticated SMTP connections kept open per process, also the max of concurrent sends
+EMAIL_SMTP_POOL_SIZE = int(os.getenv("EMAIL_SMTP_POOL_SIZE", 4))
+
+# Idle connections older than this are reopened, servers drop them after a few minutes
+EMAIL_SMTP_POOL_IDLE_TIMEOUT = int(os.getenv("EMAIL_SMTP_POOL_IDLE_TIMEOUT", 60))
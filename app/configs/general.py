@@ -9,6 +9,24 @@ MEDIA_FILES_PATH = STATIC_FILES_PATH + "media/"
 
 AVATARS_DIR = f"{MEDIA_FILES_PATH}avatars/"
 POSTS_PICTURES_DIR = f"{MEDIA_FILES_PATH}posts/"
+# Content addressed image store, files are sharded by the first bytes of their sha256
+IMAGES_STORE_DIR = f"{MEDIA_FILES_PATH}images/"
+DEFAULT_AVATAR = "media/avatars/no_avatar.jpg"
+# Uploaded files wait here until the celery worker processes them
+UPLOADS_STAGING_DIR = os.getenv("UPLOADS_STAGING_DIR", f"{MEDIA_FILES_PATH}staging/")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 64 * 1024))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 10 * 1024 * 1024))
+# Decompression bomb guard, a small file can still decode to a huge bitmap
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 64_000_000))
+# Bulk regeneration of the stored images variants, workers default to the number of cores
+MEDIA_REPROCESS_CHUNK_SIZE = int(os.getenv("MEDIA_REPROCESS_CHUNK_SIZE", 500))
+MEDIA_REPROCESS_WORKERS = int(os.getenv("MEDIA_REPROCESS_WORKERS", os.cpu_count() or 1))
+# Files younger than this are never swept, their rows may not be committed yet
+MEDIA_SWEEP_GRACE_PERIOD = int(os.getenv("MEDIA_SWEEP_GRACE_PERIOD", 24 * 60 * 60))
+# Days a VIP status lasts, counted from Users.viped_at
+VIP_DURATION_DAYS = int(os.getenv("VIP_DURATION_DAYS", 30))
+# Recompile email / report templates when their file changes, for development
+TEMPLATES_AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "false").lower() in ("1", "true", "yes")
 
 ADMINS_EMAILS: str = os.getenv("ADMINS_EMAILS")
 
@@ -19,6 +37,9 @@ VIPS_POST_IMAGES_LIMIT = int(os.getenv("VIPS_POST_IMAGES_LIMIT"))
 
 POSTS_LIMIT = int(os.getenv("POSTS_LIMIT"))
 VIPS_POSTS_LIMIT = int(os.getenv("VIPS_POSTS_LIMIT"))
+
+COUNT_CACHE_TTL = int(os.getenv("COUNT_CACHE_TTL", 30))
+COUNT_CACHE_MAX_ENTRIES = int(os.getenv("COUNT_CACHE_MAX_ENTRIES", 1024))
 admins_emails: list[str] = [
     email.strip() for email in ADMINS_EMAILS.split(",") if email.strip()
 ]
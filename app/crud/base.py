@@ -1,10 +1,26 @@
+import operator
 from datetime import datetime
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
-from sqlalchemy import func
+from decimal import Decimal
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+from sqlalchemy import and_, delete, func, literal, tuple_
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import desc, asc
+from services.pagination import count_query
+from services.cache import dependent_table_tags, invalidate_tags, model_cache_tags
 
 ModelType = TypeVar("ModelType")
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
@@ -20,6 +36,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db_obj = self._model(**obj_in_data)
         db.add(db_obj)
         await db.commit()
+        await invalidate_tags(model_cache_tags(db_obj))
         return db_obj
 
     async def get(self, session: AsyncSession, *args, **kwargs) -> Optional[ModelType]:
@@ -40,6 +57,20 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         )
         return result.scalars().all()
 
+    async def get_multi_in(
+        self, db: AsyncSession, field_name: str, values
+    ) -> List[ModelType]:
+        """
+        Fetch every row whose `field_name` is one of `values` in a single query.
+        """
+        values = list(set(values))
+        if not values:
+            return []
+
+        field = getattr(self._model, field_name)
+        result = await db.execute(select(self._model).filter(field.in_(values)))
+        return result.scalars().all()
+
     async def update(
         self,
         db: AsyncSession,
@@ -50,6 +81,8 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     ) -> Optional[ModelType]:
         db_obj = db_obj or await self.get(db, **kwargs)
         if db_obj is not None:
+            # Tags of the old foreign key values must be invalidated as well
+            tags = model_cache_tags(db_obj)
             obj_data = db_obj.dict()
             if isinstance(obj_in, dict):
                 update_data = obj_in
@@ -60,29 +93,49 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
                     setattr(db_obj, field, update_data[field])
             db.add(db_obj)
             await db.commit()
+            await invalidate_tags(tags + model_cache_tags(db_obj))
         return db_obj
 
     async def delete(
         self, db: AsyncSession, *args, db_obj: Optional[ModelType] = None, **kwargs
     ) -> ModelType:
         db_obj = db_obj or await self.get(db, *args, **kwargs)
+        tags = model_cache_tags(db_obj) + dependent_table_tags(db_obj)
         await db.delete(db_obj)
         await db.commit()
+        await invalidate_tags(tags)
         return db_obj
 
-    async def get_multi_filtered(
+    async def delete_multi(self, db: AsyncSession, *args, **kwargs) -> List[ModelType]:
+        """
+        Delete every row matching the filters with a single DELETE ... RETURNING,
+        returns the deleted rows.
+        """
+        result = await db.execute(
+            delete(self._model).filter(*args).filter_by(**kwargs).returning(self._model)
+        )
+        db_objs = result.scalars().all()
+        tags = [tag for db_obj in db_objs for tag in model_cache_tags(db_obj)]
+        await db.commit()
+        await invalidate_tags(tags)
+        return db_objs
+
+    def _filter_conditions(self, filters: List[Tuple[Any, str, Callable]]) -> list:
+        return [
+            compare(getattr(self._model, field_name), value)
+            for value, field_name, compare in filters
+            if value is not None
+        ]
+
+    def _build_filtered_query(
         self,
-        db: AsyncSession,
         *args,
-        offset: int = 0,
-        limit: int = 100,
         created_start_date: Optional[datetime] = None,
         created_end_date: Optional[datetime] = None,
         is_vip: Optional[bool] = None,
         is_activated: Optional[bool] = None,
         min_price: Optional[float] = None,
         max_price: Optional[float] = None,
-        order_by: Optional[str] = None,
         id: Optional[str] = None,
         title: Optional[str] = None,
         category: Optional[str] = None,
@@ -98,81 +151,69 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         owner_field_name="owner",
         activated_field_name="is_activated",
         **kwargs,
-    ) -> List[ModelType]:
-        # Build the base query with all conditions but without offset and limit
-        query = select(self._model).filter(*args)
+    ):
+        # A float would be bound as FLOAT and postgres would cast the numeric
+        # price column instead, leaving its indexes and statistics unused
+        min_price, max_price = (
+            None if price is None else Decimal(str(price)) for price in (min_price, max_price)
+        )
 
-        # Apply filters based on provided parameters
-        if created_start_date:
-            query = query.filter(
-                getattr(self._model, created_at_field_name) >= created_start_date
-            )
-        if created_end_date:
-            query = query.filter(
-                getattr(self._model, created_at_field_name) <= created_end_date
-            )
-        if is_vip is not None:
-            query = query.filter(getattr(self._model, vip_field_name) == is_vip)
-        if is_activated is not None:
-            query = query.filter(
-                getattr(self._model, activated_field_name) == is_activated
-            )
-        if min_price is not None:
-            query = query.filter(getattr(self._model, price_field_name) >= min_price)
-        if max_price is not None:
-            query = query.filter(getattr(self._model, price_field_name) <= max_price)
-        if id is not None:
-            query = query.filter(getattr(self._model, id_field_name) == id)
-        if title is not None:
-            query = query.filter(
-                getattr(self._model, title_field_name).ilike(f"%{title}%")
-            )
-        if category is not None:
-            query = query.filter(getattr(self._model, category_field_name) == category)
-        if subcategory is not None:
-            query = query.filter(
-                getattr(self._model, subcategory_field_name) == subcategory
-            )
-        if owner is not None:
-            query = query.filter(getattr(self._model, owner_field_name) == owner)
+        # (value, field name, comparison), filters left as None are skipped
+        filters = [
+            (created_start_date, created_at_field_name, operator.ge),
+            (created_end_date, created_at_field_name, operator.le),
+            (is_vip, vip_field_name, operator.eq),
+            (is_activated, activated_field_name, operator.eq),
+            (min_price, price_field_name, operator.ge),
+            (max_price, price_field_name, operator.le),
+            (id, id_field_name, operator.eq),
+            (title, title_field_name, lambda column, value: column.ilike(f"%{value}%")),
+            (category, category_field_name, operator.eq),
+            (subcategory, subcategory_field_name, operator.eq),
+            (owner, owner_field_name, operator.eq),
+        ]
+
+        # Build the base query with all conditions but without ordering, offset and limit
+        query = select(self._model).filter(*args, *self._filter_conditions(filters))
 
         # If additional filters are provided via kwargs (ensure they match column names)
         if kwargs:
             query = query.filter_by(**kwargs)
 
-        # Calculate total count before applying offset and limit
-        total_count_query = select(func.count()).select_from(query.subquery())
-        total_count_result = await db.execute(total_count_query)
-        total = total_count_result.scalar_one()
+        return query
+
+    async def get_multi_filtered(
+        self,
+        db: AsyncSession,
+        *args,
+        offset: int = 0,
+        limit: int = 100,
+        order_by: Optional[str] = None,
+        count_strategy: str = "exact",
+        created_at_field_name: str = "created_at",
+        vip_field_name: str = "is_vip",
+        price_field_name: str = "price",
+        **filters,
+    ) -> Tuple[List[ModelType], Optional[int]]:
+        query = self._build_filtered_query(
+            *args,
+            created_at_field_name=created_at_field_name,
+            vip_field_name=vip_field_name,
+            price_field_name=price_field_name,
+            **filters,
+        )
+
+        # Calculate total count before applying offset and limit,
+        # total is None when the "none" count strategy is used
+        total = await count_query(db, query, count_strategy)
 
         # Now apply offset and limit to the original query for pagination
 
-        if order_by == "newest":
-            query = query.order_by(
-                desc(getattr(self._model, vip_field_name)),
-                desc(getattr(self._model, created_at_field_name)),
-            )
-        elif order_by == "oldest":
-            query = query.order_by(
-                desc(getattr(self._model, vip_field_name)),
-                asc(getattr(self._model, created_at_field_name)),
-            )
-        elif order_by == "cheapest":
-            query = query.order_by(
-                desc(getattr(self._model, vip_field_name)),
-                asc(getattr(self._model, price_field_name)),
-            )
-        elif order_by == "expensive":
-            query = query.order_by(
-                desc(getattr(self._model, vip_field_name)),
-                desc(getattr(self._model, price_field_name)),
+        query = query.order_by(
+            *self._order_by_clauses(
+                order_by, created_at_field_name, vip_field_name, price_field_name
             )
-        else:
-            # If no specific sorting is provided, default to prioritizing VIPs first
-            query = query.order_by(desc(getattr(self._model, vip_field_name)))
-
-        # Calculate total count before applying offset and limit
-        # Your total count logic here...
+        )
 
         # Apply offset and limit for pagination
         query = query.offset(offset).limit(limit)
@@ -181,6 +222,164 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
         return posts, total
 
+    def _order_by_clauses(
+        self,
+        order_by: Optional[str],
+        created_at_field_name: str,
+        vip_field_name: str,
+        price_field_name: str,
+    ) -> list:
+        """
+        ORDER BY of get_multi_filtered, VIPs always come first.
+        """
+        # Only the chosen sort key is looked up, not every model has a price
+        sort_keys = {
+            "newest": (created_at_field_name, desc),
+            "oldest": (created_at_field_name, asc),
+            "cheapest": (price_field_name, asc),
+            "expensive": (price_field_name, desc),
+        }
+        clauses = [desc(getattr(self._model, vip_field_name))]
+        if order_by in sort_keys:
+            field_name, direction = sort_keys[order_by]
+            clauses.append(direction(getattr(self._model, field_name)))
+        return clauses
+
+    def _keyset_columns(
+        self,
+        order_by: Optional[str],
+        created_at_field_name: str,
+        vip_field_name: str,
+        price_field_name: str,
+        id_field_name: str,
+    ) -> List[Tuple[str, bool]]:
+        """
+        (field name, descending) pairs that give a total order for every `order_by` variant.
+        """
+        sort_keys = {
+            "newest": (created_at_field_name, True),
+            "oldest": (created_at_field_name, False),
+            "cheapest": (price_field_name, False),
+            "expensive": (price_field_name, True),
+        }
+        # Keyset pagination needs a deterministic order, so default to "newest"
+        sort_key, sort_desc = sort_keys.get(order_by, sort_keys["newest"])
+        return [(vip_field_name, True), (sort_key, sort_desc), (id_field_name, sort_desc)]
+
+    def keyset_types(
+        self,
+        order_by: Optional[str] = None,
+        created_at_field_name: str = "created_at",
+        vip_field_name: str = "is_vip",
+        price_field_name: str = "price",
+        id_field_name: str = "id",
+    ) -> Tuple[type, ...]:
+        """
+        Python types of the values of a get_multi_keyset cursor for `order_by`.
+        """
+        return tuple(
+            getattr(self._model, field_name).type.python_type
+            for field_name, _ in self._keyset_columns(
+                order_by,
+                created_at_field_name,
+                vip_field_name,
+                price_field_name,
+                id_field_name,
+            )
+        )
+
+    @staticmethod
+    def _seek_conditions(columns: List[Tuple[Any, bool]], cursor: Sequence[Any]) -> list:
+        """
+        Rows after `cursor` in the order of `columns`, as conditions each selecting
+        rows that come after all the rows of the previous ones.
+
+        Consecutive columns sorted the same way are compared together, and each
+        condition is equalities on the leading groups plus a row value comparison
+        on the next one, which Postgres starts an index scan at (an OR of them
+        would only be a filter). (a DESC, b ASC, c ASC) after (x, y, z) is
+        [a = x AND (b, c) > (y, z), a < x].
+        """
+        groups = []
+        for (column, is_desc), value in zip(columns, cursor):
+            if groups and groups[-1][0] == is_desc:
+                groups[-1][1].append(column)
+                groups[-1][2].append(value)
+            else:
+                groups.append((is_desc, [column], [value]))
+
+        conditions, equal = [], []
+        for is_desc, group_columns, values in groups:
+            row = tuple_(*group_columns) if len(group_columns) > 1 else group_columns[0]
+            value = tuple(values) if len(values) > 1 else literal(values[0], row.type)
+            conditions.append(and_(*equal, row < value if is_desc else row > value))
+            equal.extend(column == group_value for column, group_value in zip(group_columns, values))
+        return conditions[::-1]
+
+    async def get_multi_keyset(
+        self,
+        db: AsyncSession,
+        *args,
+        cursor: Optional[Sequence[Any]] = None,
+        limit: int = 100,
+        order_by: Optional[str] = None,
+        created_at_field_name: str = "created_at",
+        vip_field_name: str = "is_vip",
+        price_field_name: str = "price",
+        id_field_name: str = "id",
+        **filters,
+    ) -> Tuple[List[ModelType], Optional[Tuple[Any, ...]]]:
+        """
+        Cursor based alternative to get_multi_filtered.
+
+        `cursor` is the (is_vip, sort key, id) tuple of the last row of the previous page.
+        Rows are located with seek conditions instead of OFFSET, so every page costs the same.
+        Returns the rows and the cursor of the next page (None on the last page).
+        """
+        query = self._build_filtered_query(
+            *args,
+            created_at_field_name=created_at_field_name,
+            vip_field_name=vip_field_name,
+            price_field_name=price_field_name,
+            id_field_name=id_field_name,
+            **filters,
+        )
+
+        columns = [
+            (getattr(self._model, field_name), is_desc)
+            for field_name, is_desc in self._keyset_columns(
+                order_by,
+                created_at_field_name,
+                vip_field_name,
+                price_field_name,
+                id_field_name,
+            )
+        ]
+
+        query = query.order_by(
+            *[desc(column) if is_desc else asc(column) for column, is_desc in columns]
+        )
+
+        # Each seek is an index range scan, the next one only runs when the page
+        # isn't full yet, e.g. for a page going from the VIP posts to the others
+        seeks = [None] if cursor is None else self._seek_conditions(columns, cursor)
+        items = []
+        for condition in seeks:
+            page_query = query if condition is None else query.filter(condition)
+            # Fetch one extra row to find out whether there is a next page
+            result = await db.execute(page_query.limit(limit + 1 - len(items)))
+            items.extend(result.scalars().all())
+            if len(items) > limit:
+                break
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            last = items[-1]
+            next_cursor = tuple(getattr(last, column.key) for column, _ in columns)
+
+        return items, next_cursor
+
     async def get_total_before(self, db: AsyncSession, field_name: str, date) -> int:
         field = getattr(self._model, field_name, None)
         if field is None:
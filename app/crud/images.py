@@ -0,0 +1,67 @@
+from collections import Counter
+from typing import Iterable, List
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from crud.base import CRUDBase
+from models.images import StoredImage
+from schemas.images import StoredImageSchema
+
+
+class CRUDStoredImage(CRUDBase[StoredImage, StoredImageSchema, StoredImageSchema]):
+    async def acquire(
+        self, db: AsyncSession, hash: str, image: str, commit: bool = True
+    ) -> str:
+        """
+        Add a reference to a stored image, registering it on first use.
+        Returns the url of the image.
+        """
+        stmt = (
+            insert(self._model)
+            .values(hash=hash, image=image, ref_count=1)
+            .on_conflict_do_update(
+                index_elements=[self._model.hash],
+                set_={"ref_count": self._model.ref_count + 1},
+            )
+            .returning(self._model.image)
+        )
+        image_url = (await db.execute(stmt)).scalar_one()
+        if commit:
+            await db.commit()
+        return image_url
+
+    async def release(
+        self, db: AsyncSession, hashes: Iterable[str], commit: bool = True
+    ) -> List[str]:
+        """
+        Drop one reference per hash occurrence.
+        Returns the hashes that are no longer referenced, their rows are removed
+        and their files can be deleted.
+        """
+        counts = Counter(hash for hash in hashes if hash)
+        if not counts:
+            return []
+
+        # One statement per distinct decrement, usually there's a single one
+        by_decrement = {}
+        for hash, count in counts.items():
+            by_decrement.setdefault(count, []).append(hash)
+        for decrement, group in by_decrement.items():
+            await db.execute(
+                update(self._model)
+                .where(self._model.hash.in_(group))
+                .values(ref_count=self._model.ref_count - decrement)
+            )
+
+        result = await db.execute(
+            delete(self._model)
+            .where(self._model.hash.in_(list(counts)), self._model.ref_count <= 0)
+            .returning(self._model.hash)
+        )
+        unreferenced = list(result.scalars().all())
+        if commit:
+            await db.commit()
+        return unreferenced
+
+
+crud_stored_image = CRUDStoredImage(StoredImage)
@@ -1,9 +1,120 @@
+import uuid
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import case, desc, func, literal_column, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from crud.base import CRUDBase
-from models.posts import Post, PostImage
+from models.posts import POST_SEARCH_CONFIG, Post, PostImage, post_search_document
+from models.users import Users
 from schemas.posts import PostCreateInSchema, PostImageUpdate, PostUpdateSchema
+from services.pagination import count_query
+from services.cache import invalidate_tags, model_cache_tags
+
+
+class CRUDPost(CRUDBase[Post, PostCreateInSchema, PostUpdateSchema]):
+    async def search(
+        self,
+        db: AsyncSession,
+        search: str,
+        *args,
+        offset: int = 0,
+        limit: int = 100,
+        count_strategy: str = "exact",
+        **filters,
+    ) -> Tuple[List[Post], Optional[int]]:
+        """
+        Full-text search over title and description, ranked by relevance.
+
+        Accepts the same filters as get_multi_filtered, `search` uses the web search
+        syntax ("quoted phrases", -excluded, or).
+        """
+        document = post_search_document()
+        ts_query = func.websearch_to_tsquery(
+            literal_column(f"'{POST_SEARCH_CONFIG}'::regconfig"), search
+        )
+
+        query = self._build_filtered_query(*args, **filters).filter(
+            document.op("@@")(ts_query)
+        )
+
+        total = await count_query(db, query, count_strategy)
+
+        query = query.order_by(
+            desc(func.ts_rank_cd(document, ts_query)),
+            desc(self._model.is_vip),
+            desc(self._model.created_at),
+        )
+        result = await db.execute(query.offset(offset).limit(limit))
+        return result.scalars().all(), total
+
+    async def sync_vip_with_owners(self, db: AsyncSession) -> List[Post]:
+        """
+        Copy every owner's is_vip onto their posts with a single UPDATE ... FROM
+        users, only the posts whose flag differs are written. Returns them.
+        """
+        result = await db.execute(
+            update(self._model)
+            .where(
+                self._model.owner == Users.id,
+                self._model.is_vip.is_distinct_from(Users.is_vip),
+            )
+            .values(is_vip=Users.is_vip)
+            .returning(self._model)
+            .execution_options(synchronize_session="fetch")
+        )
+        db_objs = result.scalars().all()
+        tags = [tag for db_obj in db_objs for tag in model_cache_tags(db_obj)]
+        await db.commit()
+        await invalidate_tags(tags)
+        return db_objs
+
 
-CRUDPost = CRUDBase[Post, PostCreateInSchema, PostUpdateSchema]
 crud_post = CRUDPost(Post)
 
-CRUDPostImage = CRUDBase[PostImage, PostImageUpdate, PostImageUpdate]
-crud_postimage = CRUDPost(PostImage)
+
+class CRUDPostImage(CRUDBase[PostImage, PostImageUpdate, PostImageUpdate]):
+    async def get_post_images(self, db: AsyncSession, post_id) -> List[PostImage]:
+        result = await db.execute(
+            select(self._model)
+            .filter(self._model.post == post_id)
+            .order_by(self._model.position, self._model.id)
+        )
+        return result.scalars().all()
+
+    async def next_position(self, db: AsyncSession, post_id) -> int:
+        result = await db.execute(
+            select(func.coalesce(func.max(self._model.position) + 1, 0)).filter(
+                self._model.post == post_id
+            )
+        )
+        return result.scalar_one()
+
+    async def set_positions(
+        self, db: AsyncSession, post_id, positions: Dict[uuid.UUID, int]
+    ) -> List[PostImage]:
+        """
+        Move images of a post to new positions with a single UPDATE.
+        Images already at their position aren't written. Returns the moved images.
+        """
+        if not positions:
+            return []
+
+        new_position = case(positions, value=self._model.id)
+        result = await db.execute(
+            update(self._model)
+            .where(
+                self._model.post == post_id,
+                self._model.id.in_(list(positions)),
+                self._model.position != new_position,
+            )
+            .values(position=new_position)
+            .returning(self._model)
+            .execution_options(synchronize_session="fetch")
+        )
+        db_objs = result.scalars().all()
+        tags = [tag for db_obj in db_objs for tag in model_cache_tags(db_obj)]
+        await db.commit()
+        await invalidate_tags(tags)
+        return db_objs
+
+
+crud_postimage = CRUDPostImage(PostImage)
@@ -1,6 +1,111 @@
+from datetime import date
+from typing import Any, Dict, List, Optional, Union
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from crud.base import CRUDBase
 from models.users import Users
 from schemas.users import UserCreateInSchema, UserPasswordChangeSchema
+from services.cache import invalidate_tags, model_cache_tags
+from services.principal import PRINCIPAL_FIELDS, principal_cache
+
+
+class CRUDUser(CRUDBase[Users, UserCreateInSchema, UserPasswordChangeSchema]):
+    async def get_by_login(self, db: AsyncSession, identifier: str) -> Optional[Users]:
+        """
+        User whose username or email is `identifier`, case-insensitively, in one query.
+        A username match wins over an email match.
+        """
+        identifier = identifier.lower()
+        username_matches = func.lower(self._model.username) == identifier
+        result = await db.execute(
+            select(self._model)
+            .filter(or_(username_matches, func.lower(self._model.email) == identifier))
+            .order_by(username_matches.desc())
+            .limit(1)
+        )
+        return result.scalars().first()
+
+    async def create_if_unique(
+        self, db: AsyncSession, obj_in: UserCreateInSchema, commit: bool = True
+    ) -> Optional[Users]:
+        """
+        INSERT ... ON CONFLICT DO NOTHING, returns None when the username or
+        email is taken. Concurrent signups can't both pass a uniqueness check.
+        With commit=False the caller commits, a new user isn't cached anywhere yet.
+        """
+        result = await db.execute(
+            insert(self._model)
+            .values(**dict(obj_in))
+            .on_conflict_do_nothing()
+            .returning(self._model)
+        )
+        db_obj = result.scalars().first()
+        if not commit:
+            return db_obj
+        await db.commit()
+        if db_obj is not None:
+            await invalidate_tags(model_cache_tags(db_obj))
+        return db_obj
+
+    async def update(
+        self,
+        db: AsyncSession,
+        *,
+        obj_in: Union[UserPasswordChangeSchema, Dict[str, Any]],
+        db_obj: Optional[Users] = None,
+        **kwargs,
+    ) -> Optional[Users]:
+        """
+        Update a user, dropping its cached principal when a field the auth
+        guards rely on changes.
+        """
+        db_obj = db_obj or await self.get(db, **kwargs)
+        if db_obj is None:
+            return None
+
+        update_data = obj_in if isinstance(obj_in, dict) else obj_in.dict(exclude_unset=True)
+        user_id = db_obj.id
+        principal_changed = any(
+            field in update_data and update_data[field] != getattr(db_obj, field)
+            for field in PRINCIPAL_FIELDS
+        )
+
+        db_obj = await super().update(db, obj_in=obj_in, db_obj=db_obj)
+        if principal_changed:
+            await principal_cache.invalidate(user_id)
+        return db_obj
+
+    async def delete(
+        self, db: AsyncSession, *args, db_obj: Optional[Users] = None, **kwargs
+    ) -> Users:
+        db_obj = db_obj or await self.get(db, *args, **kwargs)
+        user_id = db_obj.id
+        db_obj = await super().delete(db, db_obj=db_obj)
+        await principal_cache.invalidate(user_id)
+        return db_obj
+
+    async def expire_vips(self, db: AsyncSession, viped_before: date) -> List[Users]:
+        """
+        Drop the VIP status of every user who became VIP before `viped_before`
+        with a single UPDATE, returns the updated users.
+        """
+        result = await db.execute(
+            update(self._model)
+            # Plain `is_vip` so the partial ix_users_vip_viped_at index matches
+            .where(self._model.is_vip, self._model.viped_at < viped_before)
+            .values(is_vip=False, viped_at=None)
+            .returning(self._model)
+            .execution_options(synchronize_session="fetch")
+        )
+        db_objs = result.scalars().all()
+        tags = [tag for db_obj in db_objs for tag in model_cache_tags(db_obj)]
+        user_ids = [db_obj.id for db_obj in db_objs]
+        await db.commit()
+        await invalidate_tags(tags)
+        for user_id in user_ids:
+            await principal_cache.invalidate(user_id)
+        return db_objs
+
 
-CRUDUser = CRUDBase[Users, UserCreateInSchema, UserPasswordChangeSchema]
 crud_user = CRUDUser(Users)
@@ -1,11 +1,13 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from crud.users import crud_user
+from services.principal import principal_cache
 from services.tokens import verify_token
 from sqlalchemy.ext.asyncio import AsyncSession
 from dependencies.db import get_async_session
 
 from models.users import Users
+from schemas.users import PrincipalSchema
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/users/auth/token")
 
@@ -21,3 +23,27 @@ async def get_current_user(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
     return user
+
+
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    session: AsyncSession = Depends(get_async_session),
+) -> PrincipalSchema:
+    """
+    Identity of the authenticated user, for routes that don't need the whole row.
+    Served from the principal cache, Postgres is only queried on a miss
+    (the session doesn't take a connection until it's used).
+    """
+    token_data = await verify_token(token, "access")
+    principal, generation = await principal_cache.get(token_data.user_id)
+    if principal is not None:
+        return principal
+
+    user = await crud_user.get(session, id=token_data.user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+    principal = PrincipalSchema.model_validate(user)
+    await principal_cache.set(principal, generation)
+    return principal
@@ -1,26 +1,25 @@
 from fastapi import Depends, HTTPException, status
 from crud.posts import crud_post
 from dependencies.db import get_async_session
-from models.users import Users
-from dependencies.auth import get_current_user
+from schemas.users import PrincipalSchema
+from dependencies.auth import get_current_principal
 from sqlalchemy.ext.asyncio import AsyncSession
-from dependencies.users import is_user_stuff
 
 
 async def is_user_owner_or_stuff(
     post_id: str,
-    user: Users = Depends(get_current_user),
+    user: PrincipalSchema = Depends(get_current_principal),
     db: AsyncSession = Depends(get_async_session),
 ) -> bool:
 
-    if await is_user_stuff(user):
+    if user.is_staff:
         return True
 
     if not user.is_activated:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User isn't activated"
         )
-    post = crud_post.get(db, id=post_id)
+    post = await crud_post.get(db, id=post_id)
 
     if not post:
         raise HTTPException(
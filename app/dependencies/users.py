@@ -1,10 +1,10 @@
 from fastapi import Depends, HTTPException, status
-from models.users import Users
-from dependencies.auth import get_current_user
+from schemas.users import PrincipalSchema
+from dependencies.auth import get_current_principal
 
 
 async def is_user_activated(
-    user: Users = Depends(get_current_user),
+    user: PrincipalSchema = Depends(get_current_principal),
 ) -> bool:
     if user.is_activated:
         return True
@@ -15,7 +15,7 @@ async def is_user_activated(
 
 
 async def is_user_stuff(
-    user: Users = Depends(get_current_user),
+    user: PrincipalSchema = Depends(get_current_principal),
 ) -> bool:
     if user.is_staff:
         return True
@@ -25,7 +25,7 @@ async def is_user_stuff(
             detail="User hasn't enough permissions",
         )
 
-async def is_user_not_activated(user: Users = Depends(get_current_user)):
+async def is_user_not_activated(user: PrincipalSchema = Depends(get_current_principal)):
     if user.is_activated:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
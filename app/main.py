@@ -5,12 +5,14 @@ from api.v1.routers import router as v1_router
 from fastapi import APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
 
 from configs.general import STATIC_FILES_PATH, setup_logger
-from configs.db import REDIS_URL
-from redis import asyncio as aioredis
+import asyncio
+from services.cache import close_redis, get_redis
+from services.category_registry import category_registry
+from services.principal import principal_cache
+from services.revocation import token_revocations
+from dependencies.db import async_session_maker
 
 router = APIRouter(
     prefix="/api",
@@ -57,5 +59,19 @@ if __name__ == "__main__":
 
 @app.on_event("startup")
 async def startup_event():
-    redis = aioredis.from_url(REDIS_URL, encoding="utf8", decode_responses=True)
-    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+    # Cache errors are tolerated by the cache helpers, so no connection check here
+    get_redis()
+
+    async with async_session_maker() as session:
+        await category_registry.load(session)
+    app.state.category_listener = asyncio.create_task(category_registry.listen())
+    app.state.principal_listener = asyncio.create_task(principal_cache.listen())
+    app.state.revocations_listener = asyncio.create_task(token_revocations.listen())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.category_listener.cancel()
+    app.state.principal_listener.cancel()
+    app.state.revocations_listener.cancel()
+    await close_redis()
@@ -6,9 +6,11 @@ from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import async_engine_from_config
 from db.db import Base, DATABASE_URL
 from models.users import Users
-from models.tokens import BlacklistedToken
+from models.tokens import RevokedToken
 from models.posts import Post, Category, SubCategory, PostImage
 from models.store import BugReport, BugReportComment
+from models.images import StoredImage
+from models.emails import EmailOutbox
 
 config = context.config
 config.set_main_option("sqlalchemy.url", DATABASE_URL)
@@ -0,0 +1,41 @@
+"""posts listing indexes
+
+Revision ID: 3f1c9a7d52e4
+Revises: a4bba01ceafa
+Create Date: 2026-10-18 10:12:41.503218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d52e4'
+down_revision = 'a4bba01ceafa'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ("ix_posts_newest", "posts", [sa.text("is_vip DESC"), sa.text("created_at DESC"), sa.text("id DESC")]),
+    ("ix_posts_oldest", "posts", [sa.text("is_vip DESC"), sa.text("created_at ASC"), sa.text("id ASC")]),
+    ("ix_posts_cheapest", "posts", [sa.text("is_vip DESC"), sa.text("price ASC"), sa.text("id ASC")]),
+    ("ix_posts_expensive", "posts", [sa.text("is_vip DESC"), sa.text("price DESC"), sa.text("id DESC")]),
+    ("ix_posts_owner_created_at", "posts", ["owner", "created_at"]),
+    ("ix_posts_category_subcategory", "posts", ["category_id", "sub_category_id", "is_vip", "created_at"]),
+    ("ix_postimages_post", "postimages", ["post"]),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps the tables writable while the indexes are built,
+    # it can't run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
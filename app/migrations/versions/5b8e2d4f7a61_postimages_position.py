@@ -0,0 +1,53 @@
+"""postimages position
+
+Revision ID: 5b8e2d4f7a61
+Revises: c7a4e1f09b3d
+Create Date: 2026-10-18 15:02:37.640915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e2d4f7a61'
+down_revision = 'c7a4e1f09b3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'postimages',
+        sa.Column('position', sa.Integer(), nullable=False, server_default='0'),
+    )
+    # Existing images keep an arbitrary but stable order
+    op.execute(
+        """
+        UPDATE postimages
+        SET position = numbered.position
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY post ORDER BY id) - 1 AS position
+            FROM postimages
+        ) AS numbered
+        WHERE postimages.id = numbered.id
+        """
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_postimages_post_position',
+            'postimages',
+            ['post', 'position'],
+            postgresql_concurrently=True,
+        )
+        op.drop_index('ix_postimages_post', table_name='postimages', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_postimages_post', 'postimages', ['post'], postgresql_concurrently=True)
+        op.drop_index(
+            'ix_postimages_post_position', table_name='postimages', postgresql_concurrently=True
+        )
+    op.drop_column('postimages', 'position')
@@ -0,0 +1,41 @@
+"""users lower unique indexes
+
+Revision ID: 7c3d9e1a6f24
+Revises: e2f6a9c3d8b5
+Create Date: 2026-10-18 17:05:12.904371
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3d9e1a6f24'
+down_revision = 'e2f6a9c3d8b5'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ("ix_users_username_lower", "username"),
+    ("ix_users_email_lower", "email"),
+]
+
+
+def upgrade() -> None:
+    # Fails if two users only differ by case, they have to be merged or renamed first
+    with op.get_context().autocommit_block():
+        for name, column in INDEXES:
+            op.create_index(
+                name,
+                "users",
+                [sa.text(f"lower({column})")],
+                unique=True,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.drop_index(name, table_name="users", postgresql_concurrently=True)
@@ -0,0 +1,46 @@
+"""posts search indexes
+
+Revision ID: 8d2e6b0c4a19
+Revises: 3f1c9a7d52e4
+Create Date: 2026-10-18 11:03:17.284611
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e6b0c4a19'
+down_revision = '3f1c9a7d52e4'
+branch_labels = None
+depends_on = None
+
+
+# Must stay identical to models.posts.post_search_document()
+SEARCH_DOCUMENT = (
+    "to_tsvector('simple'::regconfig, "
+    "coalesce(title, '') || ' ' || coalesce(description, ''))"
+)
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Expression indexes are maintained by postgres on every insert and update
+    with op.get_context().autocommit_block():
+        op.execute(
+            f"CREATE INDEX CONCURRENTLY ix_posts_search ON posts USING gin ({SEARCH_DOCUMENT})"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY ix_posts_title_trgm ON posts USING gin (title gin_trgm_ops)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY ix_posts_description_trgm "
+            "ON posts USING gin (description gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_posts_description_trgm")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_posts_title_trgm")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_posts_search")
@@ -0,0 +1,34 @@
+"""users vip expiry index
+
+Revision ID: b3e8f5a2c917
+Revises: 9a4c7e2b1d58
+Create Date: 2026-10-18 19:02:33.118560
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8f5a2c917'
+down_revision = '9a4c7e2b1d58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_users_vip_viped_at",
+            "users",
+            ["viped_at"],
+            postgresql_where=sa.text("is_vip"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_users_vip_viped_at", table_name="users", postgresql_concurrently=True
+        )
@@ -0,0 +1,31 @@
+"""stored images
+
+Revision ID: c7a4e1f09b3d
+Revises: 8d2e6b0c4a19
+Create Date: 2026-10-18 13:41:09.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a4e1f09b3d'
+down_revision = '8d2e6b0c4a19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'storedimages',
+        sa.Column('hash', sa.String(length=64), nullable=False),
+        sa.Column('image', sa.String(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint('hash'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('storedimages')
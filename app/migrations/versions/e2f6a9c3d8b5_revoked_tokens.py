@@ -0,0 +1,80 @@
+"""revoked tokens
+
+Revision ID: e2f6a9c3d8b5
+Revises: 5b8e2d4f7a61
+Create Date: 2026-10-18 16:20:54.183027
+
+"""
+from datetime import datetime
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+from jose import jwt
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2f6a9c3d8b5'
+down_revision = '5b8e2d4f7a61'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    revoked_tokens = op.create_table(
+        'revoked_tokens',
+        sa.Column('jti', sa.String(length=64), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.Column('revoked_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('jti'),
+    )
+    op.create_index('ix_revoked_tokens_expires_at', 'revoked_tokens', ['expires_at'])
+
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('blacklisted_tokens'):
+        return
+
+    # Blacklisted tokens carry no jti, they're revoked by the sha256 of the
+    # token (see services.tokens.token_jti). Expired ones aren't moved.
+    now = datetime.utcnow()
+    rows = []
+    for token, blacklisted_on in bind.execute(
+        sa.text('SELECT token, blacklisted_on FROM blacklisted_tokens')
+    ):
+        try:
+            exp = jwt.get_unverified_claims(token).get('exp')
+        except Exception:
+            continue
+        expires_at = datetime.utcfromtimestamp(exp) if exp else None
+        if expires_at is not None and expires_at <= now:
+            continue
+        rows.append(
+            {
+                'jti': hashlib.sha256(token.encode()).hexdigest(),
+                'expires_at': expires_at,
+                'revoked_at': blacklisted_on,
+            }
+        )
+        if len(rows) >= BATCH_SIZE:
+            op.bulk_insert(revoked_tokens, rows)
+            rows = []
+    if rows:
+        op.bulk_insert(revoked_tokens, rows)
+
+    op.drop_table('blacklisted_tokens')
+
+
+def downgrade() -> None:
+    # Only token hashes were kept, the revocations can't be moved back
+    op.create_table(
+        'blacklisted_tokens',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('token', sa.String(), nullable=False),
+        sa.Column('blacklisted_on', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('token'),
+    )
+    op.drop_index('ix_revoked_tokens_expires_at', table_name='revoked_tokens')
+    op.drop_table('revoked_tokens')
@@ -0,0 +1,38 @@
+from typing import Optional
+from sqlalchemy import BigInteger, DateTime, Index, Integer, String, Text, text
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+from db.db import Base
+
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    recipient: Mapped[str] = mapped_column(String, nullable=False)
+    subject: Mapped[str] = mapped_column(String, nullable=False)
+    # Rendered message, links and tokens are built when the email is queued
+    body: Mapped[str] = mapped_column(Text, nullable=False)
+    subtype: Mapped[str] = mapped_column(String(16), nullable=False, default="html")
+    # pending -> sent, or failed once EMAIL_OUTBOX_MAX_ATTEMPTS is reached
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, default=datetime.utcnow
+    )
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, default=datetime.utcnow
+    )
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<EmailOutbox id={self.id} status={self.status}>"
+
+
+# The dispatcher only ever looks for due pending emails
+Index(
+    "ix_email_outbox_pending",
+    EmailOutbox.next_attempt_at,
+    postgresql_where=text("status = 'pending'"),
+)
@@ -0,0 +1,15 @@
+from sqlalchemy import String, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+from db.db import Base
+from datetime import datetime
+
+
+class StoredImage(Base):
+    __tablename__ = "storedimages"
+
+    # sha256 of the original upload, also the name of its files in the image store
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # Url of the default variant, what PostImage.image / Users.image reference
+    image: Mapped[str] = mapped_column(String, nullable=False)
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(nullable=False, default=datetime.now)
@@ -1,5 +1,5 @@
-from sqlalchemy import event
-from sqlalchemy import String, UUID, ForeignKey, Numeric, Integer
+from sqlalchemy import event, func, text
+from sqlalchemy import String, UUID, ForeignKey, Numeric, Integer, Index
 from sqlalchemy.orm import Mapped, mapped_column
 import uuid
 from db.db import Base
@@ -61,6 +61,65 @@ class PostImage(Base):
     )
     post: Mapped[uuid.UUID] = mapped_column(ForeignKey("posts.id", ondelete="CASCADE"))
     image: Mapped[str] = mapped_column(nullable=False)
+    # Order of the images of a post, gaps are allowed
+    position: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+
+
+# Indexes matching the listing access paths of CRUDBase.get_multi_filtered / get_multi_keyset:
+# every listing is ordered by is_vip DESC and then by created_at or price (id breaks ties).
+Index("ix_posts_newest", Post.is_vip.desc(), Post.created_at.desc(), Post.id.desc())
+Index("ix_posts_oldest", Post.is_vip.desc(), Post.created_at.asc(), Post.id.asc())
+Index("ix_posts_cheapest", Post.is_vip.desc(), Post.price.asc(), Post.id.asc())
+Index("ix_posts_expensive", Post.is_vip.desc(), Post.price.desc(), Post.id.desc())
+# User's posts listings and post limit checks
+Index("ix_posts_owner_created_at", Post.owner, Post.created_at)
+# Category / subcategory filtered listings
+Index(
+    "ix_posts_category_subcategory",
+    Post.category_id,
+    Post.sub_category_id,
+    Post.is_vip,
+    Post.created_at,
+)
+# Images of a page of posts are loaded by post id, in position order
+Index("ix_postimages_post_position", PostImage.post, PostImage.position)
+
+
+# Text search configuration used for the posts full-text index
+POST_SEARCH_CONFIG = "simple"
+
+
+def post_search_document():
+    """
+    tsvector of a post's title and description.
+
+    Built from literal SQL only so the rendered SQL is identical to the
+    ix_posts_search index expression and the planner can use the index. The
+    literals are text(), not literal_column(): Index takes the first column
+    it finds for the table to attach to, and a literal column has none.
+    """
+    return func.to_tsvector(
+        text(f"'{POST_SEARCH_CONFIG}'::regconfig"),
+        func.coalesce(Post.title, text("''"))
+        .concat(text("' '"))
+        .concat(func.coalesce(Post.description, text("''"))),
+    )
+
+
+Index("ix_posts_search", post_search_document(), postgresql_using="gin")
+# Substring (ILIKE '%...%') filters on title and description
+Index(
+    "ix_posts_title_trgm",
+    Post.title,
+    postgresql_using="gin",
+    postgresql_ops={"title": "gin_trgm_ops"},
+)
+Index(
+    "ix_posts_description_trgm",
+    Post.description,
+    postgresql_using="gin",
+    postgresql_ops={"description": "gin_trgm_ops"},
+)
 
 
 def generate_slug(target, value, oldvalue, initiator):
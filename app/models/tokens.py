@@ -1,21 +1,22 @@
-from sqlalchemy import String, DateTime
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import String, DateTime, Index
 from sqlalchemy.orm import Mapped, mapped_column
-import uuid
 from datetime import datetime
 from db.db import Base  # Assuming this is the base declarative class
 
 
-class BlacklistedToken(Base):
-    __tablename__ = "blacklisted_tokens"
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
 
-    id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
-    )
-    token: Mapped[str] = mapped_column(String, unique=True, nullable=False)
-    blacklisted_on: Mapped[datetime] = mapped_column(
-        DateTime, default=datetime.now, nullable=False
+    # jti claim of the token, sha256 of the whole token for tokens issued without one
+    jti: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # UTC expiry of the token, rows are purged once it's passed. NULL for tokens that never expire
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    revoked_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False
     )
 
     def __repr__(self):
-        return f"<BlacklistedToken token={self.token}>"
+        return f"<RevokedToken jti={self.jti}>"
+
+
+Index("ix_revoked_tokens_expires_at", RevokedToken.expires_at)
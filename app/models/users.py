@@ -1,8 +1,9 @@
-from sqlalchemy import Boolean, Date, String, UUID
+from sqlalchemy import Boolean, Date, Index, String, UUID, func, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 import uuid
 
 from db.db import Base
+from configs.general import DEFAULT_AVATAR
 from datetime import date
 
 
@@ -22,5 +23,13 @@ class Users(Base):
     is_vip: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
     viped_at: Mapped[date] = mapped_column(Date, nullable=True)
     is_staff: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
-    image: Mapped[str] = mapped_column(String, nullable=False, default="media/avatars/no_avatar.jpg")
+    image: Mapped[str] = mapped_column(String, nullable=False, default=DEFAULT_AVATAR)
     comments = relationship("BugReportComment", back_populates="user")
+
+
+# Logins and uniqueness checks compare usernames and emails case-insensitively
+Index("ix_users_username_lower", func.lower(Users.username), unique=True)
+Index("ix_users_email_lower", func.lower(Users.email), unique=True)
+
+# VIP expiry only looks at the (few) VIP users, see CRUDUser.expire_vips
+Index("ix_users_vip_viped_at", Users.viped_at, postgresql_where=text("is_vip"))
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+
+
+class StoredImageSchema(BaseModel):
+    hash: str
+    image: str
+    ref_count: int = 0
+
+    class Config:
+        from_attributes = True
@@ -1,12 +1,20 @@
 from pydantic import BaseModel
-from typing import List, Generic, TypeVar
+from typing import List, Generic, Optional, TypeVar
 
 T = TypeVar("T")
 
 
 class PaginationSchema(BaseModel, Generic[T]):
     items: List[T]
-    total: int
+    total: Optional[int] = None
+    has_more: Optional[bool] = None
     offset: int
     limit: int
     detail: str = "ok"
+
+
+class CursorPaginationSchema(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+    limit: int
+    detail: str = "ok"
@@ -9,13 +9,28 @@ from schemas.users import UserDataSchema
 class PostImageUpdate(BaseModel):
     post: uuid.UUID
     image: str
+    position: int = 0
 
     class Config:
         from_attributes = True
 
 
+class PostImagesOrderSchema(BaseModel):
+    ids: List[uuid.UUID] = Field(..., description="Every image id of the post, in the new order")
+
+
+class ImageVariantSchema(BaseModel):
+    jpeg: str
+    webp: str
+
+
 class PostImageInfo(BaseModel):
+    id: Optional[uuid.UUID] = None
+    position: Optional[int] = None
     image: str
+    thumbnail: Optional[ImageVariantSchema] = None
+    card: Optional[ImageVariantSchema] = None
+    full: Optional[ImageVariantSchema] = None
 
     class Config:
         from_attributes = True
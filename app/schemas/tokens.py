@@ -11,6 +11,9 @@ class TokenPayloadSchema(BaseModel):
     username: Optional[str] = None
     is_activated: Optional[bool] = None
     is_staff: Optional[bool] = None
+    # Set on verified tokens, used to revoke them
+    jti: Optional[str] = None
+    exp: Optional[float] = None
 
 
 # Token Schema
@@ -54,6 +54,21 @@ class UserPasswordResetSchema(BaseModel):
         from_attributes = True
 
 
+class PrincipalSchema(BaseModel):
+    """
+    What the auth guards need to know about the authenticated user.
+    """
+
+    id: uuid.UUID
+    username: str
+    is_activated: bool
+    is_staff: bool
+    is_vip: bool
+
+    class Config:
+        from_attributes = True
+
+
 class UserDataSchema(BaseModel):
     username: str
     joined_at: date
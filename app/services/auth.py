@@ -1,28 +1,77 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 from fastapi import Depends, HTTPException, status
 from passlib.context import CryptContext
+from configs.auth import (
+    BCRYPT_ROUNDS,
+    PASSWORD_HASHING_QUEUE_LIMIT,
+    PASSWORD_HASHING_WORKERS,
+)
 from crud.users import crud_user
 from dependencies.db import get_async_session
 from models.users import Users
 from sqlalchemy.ext.asyncio import AsyncSession
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
 
+# bcrypt releases the GIL, a few threads hash in parallel without blocking the event loop
+_password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASHING_WORKERS, thread_name_prefix="password-hashing"
+)
+_password_jobs = 0
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
 
+async def _run_password_job(func, *args):
+    """
+    Run a bcrypt operation in the password pool.
+
+    Beyond PASSWORD_HASHING_QUEUE_LIMIT running or waiting operations the request
+    is refused with a 503 instead of queueing up behind a burst of logins.
+    """
+    global _password_jobs
+    if _password_jobs >= PASSWORD_HASHING_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    _password_jobs += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            _password_executor, func, *args
+        )
+    finally:
+        _password_jobs -= 1
+
+
+async def get_password_hash(password) -> str:
+    return await _run_password_job(pwd_context.hash, password)
 
-def verify_password(plain_password, hashed_pass):
-    return pwd_context.verify(plain_password, hashed_pass)
+
+async def verify_password(plain_password, hashed_pass) -> bool:
+    return await _run_password_job(pwd_context.verify, plain_password, hashed_pass)
+
+
+async def verify_and_update_password(
+    plain_password, hashed_pass
+) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password, the second value is a new hash when the stored one was
+    made with other settings (e.g. BCRYPT_ROUNDS changed), None otherwise.
+    """
+    return await _run_password_job(
+        pwd_context.verify_and_update, plain_password, hashed_pass
+    )
 
 
 async def verify_user_credentials(
     username: str, password: str, session: AsyncSession = Depends(get_async_session)
 ) -> Users:
-    user = await crud_user.get(session, username=username)
-
-    if not user:
-        user = await crud_user.get(session, email=username)
+    user = await crud_user.get_by_login(session, username)
 
     if not user:
         raise HTTPException(
@@ -31,10 +80,15 @@ async def verify_user_credentials(
         )
 
     # If user is still not found or password does not match, then raise an exception
-    if not pwd_context.verify(password, user.password):
+    is_valid, new_hash = await verify_and_update_password(password, user.password)
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
 
+    # The password is known here, it's rehashed transparently with the current cost
+    if new_hash:
+        user = await crud_user.update(session, db_obj=user, obj_in={"password": new_hash})
+
     return user
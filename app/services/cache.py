@@ -0,0 +1,307 @@
+import hashlib
+import logging
+import uuid
+from collections import Counter, defaultdict
+from datetime import date
+from decimal import Decimal
+from functools import wraps
+from typing import Dict, Iterable, List
+
+import ujson
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import serialize_response
+from redis import asyncio as aioredis
+from sqlalchemy import inspect
+from starlette.requests import Request
+from starlette.responses import Response
+
+from configs.cache import (
+    RESPONSE_CACHE_DEFAULT_TTL,
+    RESPONSE_CACHE_PREFIX,
+    RESPONSE_CACHE_TTLS,
+)
+from configs.db import REDIS_URL
+
+# Tag sets must outlive every entry they reference
+_TAG_TTL = max([RESPONSE_CACHE_DEFAULT_TTL, *RESPONSE_CACHE_TTLS.values()])
+
+# Bumped on every invalidation, each invalidated tag records the value it was
+# invalidated at. A response is only stored if none of its tags were
+# invalidated after the handler started.
+_GENERATION_KEY = f"{RESPONSE_CACHE_PREFIX}:generation"
+
+# KEYS: generation counter, generation key of every invalidated tag. ARGV: tag TTL
+_BUMP_GENERATION_SCRIPT = """
+local generation = redis.call('INCR', KEYS[1])
+for i = 2, #KEYS do
+    redis.call('SET', KEYS[i], generation, 'EX', ARGV[1])
+end
+return generation
+"""
+
+# KEYS: entry, n tag sets, n tag generation keys.
+# ARGV: generation at handler start, body, entry TTL, tag TTL, n
+_STORE_SCRIPT = """
+local n = tonumber(ARGV[5])
+for i = 1, n do
+    local generation = redis.call('GET', KEYS[1 + n + i])
+    if generation and tonumber(generation) > tonumber(ARGV[1]) then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+for i = 1, n do
+    redis.call('SADD', KEYS[1 + i], KEYS[1])
+    redis.call('EXPIRE', KEYS[1 + i], ARGV[4])
+end
+return 1
+"""
+
+# Only plain values take part in cache keys, sessions, users etc. are skipped
+_KEY_VALUE_TYPES = (str, int, float, bool, date, Decimal, uuid.UUID)
+
+_redis = None
+
+# namespace -> Counter({"hit": n, "miss": n, "error": n}), per process
+cache_stats: Dict[str, Counter] = defaultdict(Counter)
+
+
+def get_redis() -> aioredis.Redis:
+    """
+    Lazily created redis client shared by the cache helpers.
+    Values are kept as bytes, cached responses are returned as is.
+    """
+    global _redis
+    if _redis is None:
+        _redis = aioredis.from_url(REDIS_URL)
+    return _redis
+
+
+async def close_redis():
+    global _redis
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
+
+
+def build_cache_key(
+    namespace: str, request: Request, params: dict, vary_on_principal: bool
+) -> str:
+    """
+    Build a cache key from the route path and its resolved parameters.
+
+    Parameters are taken after FastAPI validation, so defaults, parameter order
+    and value formatting don't produce different keys for the same response.
+    """
+    normalized = sorted(
+        (name, str(value))
+        for name, value in params.items()
+        if value is None or isinstance(value, _KEY_VALUE_TYPES)
+    )
+    parts = [request.url.path, repr(normalized)]
+
+    if vary_on_principal:
+        parts.append(request.headers.get("authorization", ""))
+
+    digest = hashlib.sha256("|".join(parts).encode()).hexdigest()
+    return f"{RESPONSE_CACHE_PREFIX}:{namespace}:{digest}"
+
+
+def _tag_key(tag: str) -> str:
+    return f"{RESPONSE_CACHE_PREFIX}:tag:{tag}"
+
+
+def _generation_key(tag: str) -> str:
+    return f"{RESPONSE_CACHE_PREFIX}:generation:{tag}"
+
+
+def model_cache_tags(db_obj, include_table: bool = True) -> List[str]:
+    """
+    Cache tags describing a model instance.
+
+    "<table>:<primary key>" for the instance itself, "<table>:<value>" for each of its
+    foreign keys (so a post is tagged with its owner and categories) and,
+    with include_table, the "<table>" tag that collection pages depend on.
+    """
+    state = inspect(db_obj)
+    mapper = state.mapper
+    table = mapper.local_table
+
+    tags = [table.name] if include_table else []
+
+    identity = state.identity or mapper.primary_key_from_instance(db_obj)
+    if identity and all(value is not None for value in identity):
+        tags.append(f"{table.name}:{':'.join(str(value) for value in identity)}")
+
+    for column in table.columns:
+        for foreign_key in column.foreign_keys:
+            value = getattr(db_obj, mapper.get_property_by_column(column).key, None)
+            if value is not None:
+                tags.append(f"{foreign_key.column.table.name}:{value}")
+
+    return tags
+
+
+def dependent_table_tags(db_obj) -> List[str]:
+    """
+    Table tags of the tables referencing db_obj's table, their rows may be
+    removed by ON DELETE CASCADE when db_obj is deleted.
+    """
+    table = inspect(db_obj).mapper.local_table
+    return [
+        dependent.name
+        for dependent in table.metadata.sorted_tables
+        if dependent is not table
+        and any(fk.column.table is table for fk in dependent.foreign_keys)
+    ]
+
+
+def add_cache_tags(request: Request, *tags: str):
+    """
+    Tag the response cached for the current request, see cached_response.
+    """
+    if not hasattr(request.state, "cache_tags"):
+        request.state.cache_tags = set()
+    request.state.cache_tags.update(tags)
+
+
+async def invalidate_tags(tags: Iterable[str]):
+    """
+    Drop every cached response tagged with one of `tags`.
+    Failures are logged only, cache invalidation never breaks a write.
+    """
+    tags = set(tags)
+    tag_keys = [_tag_key(tag) for tag in tags]
+    if not tag_keys:
+        return
+
+    try:
+        redis = get_redis()
+        # Before the entries are dropped, so a response computed from the old
+        # data can't be stored back once they're gone
+        await redis.register_script(_BUMP_GENERATION_SCRIPT)(
+            keys=[_GENERATION_KEY, *(_generation_key(tag) for tag in tags)],
+            args=[_TAG_TTL],
+        )
+        keys = await redis.sunion(tag_keys)
+        await redis.delete(*keys, *tag_keys)
+    except Exception as e:
+        logging.error(f"Response cache invalidation error: {e}")
+
+
+async def _store_response(
+    redis, namespace: str, key: str, body: bytes, expire: int, generation, request: Request
+):
+    """
+    Store a response with its tags, unless one of them was invalidated after
+    `generation` was read, the result may predate that write.
+    """
+    tags = list(getattr(request.state, "cache_tags", ()))
+    try:
+        await redis.register_script(_STORE_SCRIPT)(
+            keys=[
+                key,
+                *(_tag_key(tag) for tag in tags),
+                *(_generation_key(tag) for tag in tags),
+            ],
+            args=[int(generation or 0), body, expire, _TAG_TTL, len(tags)],
+        )
+    except Exception as e:
+        logging.error(f"Response cache write error: {e}")
+        cache_stats[namespace]["error"] += 1
+
+
+async def _serialize_result(request: Request, result) -> bytes:
+    """
+    The body FastAPI would send for a route's result: validated and filtered by
+    the route's response_model and its response_model_* options when it has one.
+    """
+    route = request.scope.get("route")
+    if getattr(route, "response_field", None) is None:
+        return ujson.dumps(jsonable_encoder(result)).encode()
+
+    content = await serialize_response(
+        field=route.response_field,
+        response_content=result,
+        include=route.response_model_include,
+        exclude=route.response_model_exclude,
+        by_alias=route.response_model_by_alias,
+        exclude_unset=route.response_model_exclude_unset,
+        exclude_defaults=route.response_model_exclude_defaults,
+        exclude_none=route.response_model_exclude_none,
+    )
+    return ujson.dumps(content).encode()
+
+
+def cached_response(namespace: str, vary_on_principal: bool = False):
+    """
+    Cache the JSON response of a route in redis.
+
+    Must be placed below the router decorator and the route must accept a
+    `request: Request` parameter. The result is serialized once, through the
+    route's response_model as FastAPI would, and the stored bytes are returned
+    directly on a hit, so hits and misses send the same body. Lifetime comes
+    from RESPONSE_CACHE_TTLS.
+    Tags added with add_cache_tags while handling the request are attached to
+    the entry, so it's dropped by invalidate_tags when the tagged data is written.
+
+    :param namespace: Cache namespace of the route, also used for TTL lookup and stats.
+    :param vary_on_principal: Keep separate entries per Authorization header.
+    """
+    expire = RESPONSE_CACHE_TTLS.get(namespace, RESPONSE_CACHE_DEFAULT_TTL)
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            request: Request = kwargs.get("request")
+            key = build_cache_key(namespace, request, kwargs, vary_on_principal)
+            redis = get_redis()
+
+            try:
+                cached, generation = await redis.mget(key, _GENERATION_KEY)
+            except Exception as e:
+                logging.error(f"Response cache read error: {e}")
+                cache_stats[namespace]["error"] += 1
+                cached, generation = None, False
+
+            if cached is not None:
+                cache_stats[namespace]["hit"] += 1
+                return Response(
+                    content=cached,
+                    media_type="application/json",
+                    headers={"X-Cache": "HIT"},
+                )
+
+            cache_stats[namespace]["miss"] += 1
+            result = await func(*args, **kwargs)
+            if isinstance(result, Response):
+                return result
+
+            body = await _serialize_result(request, result)
+
+            # Without the generation a stale result couldn't be detected
+            if generation is not False:
+                await _store_response(
+                    redis, namespace, key, body, expire, generation, request
+                )
+
+            return Response(
+                content=body, media_type="application/json", headers={"X-Cache": "MISS"}
+            )
+
+        return wrapper
+
+    return decorator
+
+
+def get_cache_stats() -> Dict[str, dict]:
+    stats = {}
+    for namespace, counter in cache_stats.items():
+        requests = counter["hit"] + counter["miss"]
+        stats[namespace] = {
+            "hit": counter["hit"],
+            "miss": counter["miss"],
+            "error": counter["error"],
+            "hit_rate": round(counter["hit"] / requests, 4) if requests else 0.0,
+        }
+    return stats
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from crud.categories import crud_category, crud_subcategory
+from dependencies.db import async_session_maker
+from models.posts import Category, SubCategory
+from services.cache import get_redis
+
+CATEGORIES_VERSION_KEY = "categories:version"
+CATEGORIES_CHANNEL = "categories:changed"
+
+
+class CategoryRegistry:
+    """
+    In-process copy of the categories and subcategories tables.
+
+    Both tables are tiny and rarely change, so lookups by id, title or slug are
+    served from dictionaries. Writers call bump_version, which increments a
+    version in redis and publishes it, every process listening on the channel
+    reloads its copy.
+    """
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self._loaded = False
+        self._lock: Optional[asyncio.Lock] = None
+
+        self._categories: Dict[str, Dict] = {"id": {}, "title": {}, "slug": {}}
+        self._subcategories: Dict[str, Dict] = {"id": {}, "title": {}, "slug": {}}
+        self._subcategories_by_category: Dict[int, List[SubCategory]] = {}
+
+    async def load(self, db: AsyncSession):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            try:
+                version = int(await get_redis().get(CATEGORIES_VERSION_KEY) or 0)
+            except Exception as e:
+                logging.error(f"Categories version read error: {e}")
+                version = None
+
+            categories = await crud_category.get_multi(db, limit=None)
+            subcategories = await crud_subcategory.get_multi(db, limit=None)
+
+            by_category: Dict[int, List[SubCategory]] = {}
+            for subcategory in subcategories:
+                by_category.setdefault(subcategory.category_id, []).append(subcategory)
+
+            # Swap whole dictionaries so readers never see a half loaded registry
+            self._categories = {
+                field: {getattr(category, field): category for category in categories}
+                for field in ("id", "title", "slug")
+            }
+            self._subcategories = {
+                field: {getattr(sub, field): sub for sub in subcategories}
+                for field in ("id", "title", "slug")
+            }
+            self._subcategories_by_category = by_category
+            self.version = version
+            self._loaded = True
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if not self._loaded:
+            await self.load(db)
+
+    @staticmethod
+    def _lookup(index: Dict[str, Dict], **kwargs):
+        for field, value in kwargs.items():
+            if value is not None:
+                return index[field].get(value)
+        return None
+
+    async def get_category(
+        self,
+        db: AsyncSession,
+        *,
+        id: Optional[int] = None,
+        title: Optional[str] = None,
+        slug: Optional[str] = None,
+    ) -> Optional[Category]:
+        await self.ensure_loaded(db)
+        return self._lookup(self._categories, id=id, title=title, slug=slug)
+
+    async def get_subcategory(
+        self,
+        db: AsyncSession,
+        *,
+        id: Optional[int] = None,
+        title: Optional[str] = None,
+        slug: Optional[str] = None,
+        category_id: Optional[int] = None,
+    ) -> Optional[SubCategory]:
+        await self.ensure_loaded(db)
+        subcategory = self._lookup(self._subcategories, id=id, title=title, slug=slug)
+        if subcategory and category_id is not None and subcategory.category_id != category_id:
+            return None
+        return subcategory
+
+    async def get_categories(
+        self, db: AsyncSession, offset: int = 0, limit: Optional[int] = None
+    ) -> List[Category]:
+        await self.ensure_loaded(db)
+        categories = sorted(self._categories["id"].values(), key=lambda c: c.id)
+        return categories[offset:][:limit]
+
+    async def get_subcategories(
+        self,
+        db: AsyncSession,
+        category_id: Optional[int] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[SubCategory]:
+        await self.ensure_loaded(db)
+        if category_id is None:
+            subcategories = self._subcategories["id"].values()
+        else:
+            subcategories = self._subcategories_by_category.get(category_id, [])
+        return sorted(subcategories, key=lambda s: s.id)[offset:][:limit]
+
+    async def bump_version(self, db: AsyncSession):
+        """
+        Reload the local copy and tell the other processes to reload theirs.
+        """
+        await self.load(db)
+        try:
+            redis = get_redis()
+            version = await redis.incr(CATEGORIES_VERSION_KEY)
+            await redis.publish(CATEGORIES_CHANNEL, version)
+            self.version = version
+        except Exception as e:
+            logging.error(f"Categories version publish error: {e}")
+
+    async def listen(self):
+        """
+        Reload the registry whenever another process publishes a new version.
+        Runs until cancelled, reconnects on redis errors.
+        """
+        while True:
+            try:
+                async with get_redis().pubsub() as pubsub:
+                    await pubsub.subscribe(CATEGORIES_CHANNEL)
+                    # Versions may have changed while we weren't subscribed
+                    await self._reload()
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        if self.version is None or int(message["data"]) > self.version:
+                            await self._reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Categories listener error: {e}")
+                await asyncio.sleep(5)
+
+    async def _reload(self):
+        async with async_session_maker() as session:
+            await self.load(session)
+
+
+category_registry = CategoryRegistry()
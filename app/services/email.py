@@ -1,37 +1,35 @@
 from abc import ABC, abstractmethod
+from email.message import EmailMessage
 from datetime import datetime, timedelta
 from typing import Optional
 import aiofiles
 from fastapi import Request
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 import jwt
 from configs.auth import ALGORITHM, SECRET
-from configs.emails import EMAIL_HOST_PASSWORD, EMAIL_HOST_USER, EMAIL_HOST_USERNAME
+from services.tokens import new_jti
+from configs.emails import EMAIL_HOST_USER
+from services.smtp import smtp_pool
+from services.templates import templates
 from pathlib import Path
 
 
-class EmailSender(ABC):
-    def __init__(self):
-        self.config = ConnectionConfig(
-            MAIL_USERNAME=EMAIL_HOST_USERNAME,
-            MAIL_PASSWORD=EMAIL_HOST_PASSWORD,
-            MAIL_FROM=EMAIL_HOST_USER,
-            MAIL_PORT=587,
-            MAIL_SERVER="smtp.gmail.com",
-            MAIL_STARTTLS=True,
-            MAIL_SSL_TLS=False,
-            USE_CREDENTIALS=True,
-            VALIDATE_CERTS=True,
-        )
+def build_message(
+    recipient: str, subject: str, body: str, subtype: str = "html"
+) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = EMAIL_HOST_USER
+    message["To"] = recipient
+    message["Subject"] = subject
+    message.set_content(body, subtype=subtype)
+    return message
+
 
+class EmailSender(ABC):
     async def load_template(self, template_name):
         """
-        Load the email template from the file system based on the template name.
+        Get the compiled email template, read from disk only the first time.
         """
-        template_path = Path(__file__).parent.parent / f"templates/{template_name}"
-        with open(template_path, "r") as f:
-            template = f.read()
-        return template
+        return await templates.get(template_name)
 
     @abstractmethod
     async def prepare_email_data(self, user, request, template):
@@ -41,6 +39,13 @@ class EmailSender(ABC):
         """
         pass
 
+    async def render(self, user, request: Request) -> str:
+        """
+        Render the sender's template for `user`, links are built from `request`.
+        """
+        template = await self.load_template(self.template_name)
+        return await self.prepare_email_data(user, request, template)
+
     async def send_email(self, recipients, request: Optional[Request], template_name):
         """
         Send an email to multiple recipients.
@@ -50,20 +55,15 @@ class EmailSender(ABC):
         base_template = await self.load_template(template_name)
         # Assuming we don't need to prepare the data differently for each recipient.
         # This method might need adjustments if that's not the case.
-        prepared_template = (
-            base_template  # Directly use the loaded template for simplicity.
-        )
-
-        # Create a message schema for each recipient and send the email.
-        for email in recipients:
-            message = MessageSchema(
-                subject=self.subject,  # Utilizing subject defined in the subclass
-                recipients=[email],  # Send to the current recipient.
-                body=prepared_template,
-                subtype="html",
-            )
-            fm = FastMail(self.config)
-            await fm.send_message(message)
+        prepared_template = await self.prepare_email_data(None, request, base_template)
+
+        # One message per recipient, sent concurrently over the pooled connections.
+        messages = [
+            build_message(email, self.subject, prepared_template) for email in recipients
+        ]
+        errors = [error for error in await smtp_pool.send_many(messages) if error]
+        if errors:
+            raise errors[0]
 
 
 class VerificationEmailSender(EmailSender):
@@ -75,6 +75,7 @@ class VerificationEmailSender(EmailSender):
         token_data = {
             "user_id": str(user.id),
             "username": user.username,
+            "jti": new_jti(),
         }
         token = jwt.encode(token_data, SECRET, algorithm=ALGORITHM)
 
@@ -82,9 +83,7 @@ class VerificationEmailSender(EmailSender):
         path = request.url.path.replace("signup", "verification")[1:]
 
         url = f"{domain}{path}?token={token}"
-        prepared_template = template.replace(
-            'href="url"', f'href="{url}"'
-        )  # Correct replacement for the actual href
+        prepared_template = template.render(url=url)
 
         return prepared_template
 
@@ -103,6 +102,7 @@ class ResetPasswordEmailSender(EmailSender):
             "user_id": str(user.id),
             "username": user.username,
             "exp": exp_time.timestamp(),  # Add expiration time to the token data
+            "jti": new_jti(),
         }
 
         token = jwt.encode(token_data, SECRET, algorithm=ALGORITHM)
@@ -111,9 +111,7 @@ class ResetPasswordEmailSender(EmailSender):
         path = request.url.path.replace("password-forgot", "password-reset")[1:]
 
         url = f"{domain}{path}?token={token}"
-        prepared_template = template.replace(
-            'href="url"', f'href="{url}"'
-        )  # Correct replacement for the actual href
+        prepared_template = template.render(url=url)
         return prepared_template
 
 
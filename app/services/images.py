@@ -0,0 +1,56 @@
+from typing import Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from configs.general import DEFAULT_AVATAR
+from crud.images import crud_stored_image
+from tasks.media import remove_media_files
+from utils.images import content_hash_from_url, store_image_files
+from utils.uploads import discard_staged_uploads
+
+
+async def store_staged_image(
+    db: AsyncSession, staged_path: str, content_hash: str
+) -> str:
+    """
+    Add a reference to the content of a staged upload and return its url.
+
+    Content that is already stored isn't processed again, new content is
+    processed in a thread. The staged file is removed, the reference is
+    committed together with the caller's next commit.
+    """
+    try:
+        stored = await crud_stored_image.get(db, hash=content_hash)
+        if stored is None:
+            extension = staged_path.rsplit(".", 1)[-1].lower()
+            image_url = await run_in_threadpool(
+                store_image_files, staged_path, content_hash, extension
+            )
+        else:
+            image_url = stored.image
+    finally:
+        await discard_staged_uploads([staged_path])
+
+    return await crud_stored_image.acquire(db, content_hash, image_url, commit=False)
+
+
+async def release_images(db: AsyncSession, urls: Iterable[str]):
+    """
+    Drop the references held by rows that no longer use `urls`. Commits the
+    session, the files nobody references anymore are removed by a worker.
+    """
+    urls = list(urls)
+    unreferenced = set(
+        await crud_stored_image.release(db, [content_hash_from_url(url) for url in urls])
+    )
+
+    removed = [
+        url
+        for url in urls
+        if url
+        and url != DEFAULT_AVATAR
+        and (content_hash_from_url(url) is None or content_hash_from_url(url) in unreferenced)
+    ]
+    if removed:
+        await run_in_threadpool(remove_media_files.delay, removed)
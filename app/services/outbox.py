@@ -0,0 +1,37 @@
+import logging
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from models.emails import EmailOutbox
+from services.email import EmailSender
+from tasks.emails import dispatch_email_outbox
+
+
+async def queue_email(
+    db: AsyncSession, sender: EmailSender, user, request: Request
+) -> EmailOutbox:
+    """
+    Render the email of `sender` for `user` and add it to the outbox.
+    Nothing is committed, the email is only sent if the caller's transaction
+    commits, together with the change it's about.
+    """
+    email = EmailOutbox(
+        recipient=user.email,
+        subject=sender.subject,
+        body=await sender.render(user, request),
+    )
+    db.add(email)
+    return email
+
+
+async def dispatch_queued_emails():
+    """
+    Ask a worker to send the outbox now instead of waiting for the next beat
+    run. Call it after the commit, the beat run still picks the emails up if
+    the broker can't be reached.
+    """
+    try:
+        await run_in_threadpool(dispatch_email_outbox.delay)
+    except Exception as e:
+        logging.warning(f"Email outbox dispatch couldn't be queued: {e}")
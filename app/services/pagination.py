@@ -1,8 +1,38 @@
-from sqlalchemy import and_, select, func, true
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import time
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi import HTTPException, status
+from sqlalchemy import and_, select, func, text, true
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import Selectable
-from typing import Type
+from typing import Any, Dict, Optional, Sequence, Tuple, Type
 from db.db import Base  # Assuming this is your base model import
+from configs.general import COUNT_CACHE_MAX_ENTRIES, COUNT_CACHE_TTL
+
+COUNT_STRATEGIES = ("exact", "estimated", "cached", "none")
+
+# rendered count query hash -> (expires at, total)
+_count_cache: Dict[str, Tuple[float, int]] = {}
+
+# Type tags used to restore cursor values to the python types the columns expect
+_CURSOR_ENCODERS = {
+    datetime: ("dt", datetime.isoformat),
+    date: ("d", date.isoformat),
+    Decimal: ("dec", str),
+    uuid.UUID: ("uuid", str),
+}
+_CURSOR_DECODERS = {
+    "dt": datetime.fromisoformat,
+    "d": date.fromisoformat,
+    "dec": Decimal,
+    "uuid": uuid.UUID,
+}
 
 
 async def get_total_count(
@@ -38,3 +68,167 @@ async def get_total_posts(db: AsyncSession, model: Type[Base], **kwargs) -> int:
 
     total = await db.scalar(select(func.count()).select_from(model).where(condition))
     return total
+
+
+def encode_cursor(values: Sequence[Any], order_by: Optional[str]) -> str:
+    """
+    Encode a keyset tuple into an opaque url-safe cursor string.
+
+    :param values: The (is_vip, sort key, id) tuple of the last row on a page.
+    :param order_by: The ordering the cursor was produced for.
+    :return: The cursor string.
+    """
+    encoded = []
+    for value in values:
+        for value_type, (tag, dump) in _CURSOR_ENCODERS.items():
+            if isinstance(value, value_type):
+                encoded.append([tag, dump(value)])
+                break
+        else:
+            encoded.append([None, value])
+
+    raw = json.dumps({"o": order_by, "v": encoded}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(
+    cursor: str, order_by: Optional[str], types: Sequence[type]
+) -> Tuple[Any, ...]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    :param cursor: The cursor string received from the client.
+    :param order_by: The ordering of the current request, it must match the cursor's one.
+    :param types: The python types of the keyset values, in order.
+    :return: The keyset tuple.
+    """
+    invalid = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+    )
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        if not isinstance(data, dict) or not isinstance(data.get("v"), list):
+            raise invalid
+        values = tuple(
+            _CURSOR_DECODERS[tag](value) if tag else value for tag, value in data["v"]
+        )
+    except (binascii.Error, ValueError, KeyError, TypeError, AttributeError):
+        raise invalid
+
+    if data.get("o") != order_by:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor was issued for another ordering",
+        )
+
+    # A shorter cursor would seek on fewer columns than the query orders by
+    if len(values) != len(types) or not all(
+        isinstance(value, value_type) for value, value_type in zip(values, types)
+    ):
+        raise invalid
+
+    return values
+
+
+def _render_query(db: AsyncSession, query: Selectable) -> str:
+    return str(
+        query.compile(
+            dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True}
+        )
+    )
+
+
+async def _exact_count(db: AsyncSession, query: Selectable) -> int:
+    result = await db.execute(select(func.count()).select_from(query.subquery()))
+    return result.scalar_one()
+
+
+async def _explain_rows(db: AsyncSession, query: Selectable) -> int:
+    """
+    Planner row estimate of `query`. The statement is sent as compiled with its
+    bound parameters, not through text(), so user input is never parsed as SQL.
+    """
+    compiled = query.compile(dialect=db.get_bind().dialect)
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    connection = await db.connection()
+    result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params)
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Plan Rows"]
+
+
+async def _estimated_count(db: AsyncSession, query: Selectable) -> int:
+    # A failing estimate only rolls back its savepoint, the exact count
+    # fallback still runs in a usable transaction
+    async with db.begin_nested():
+        if query.whereclause is None:
+            # Unfiltered listing, the table statistics are enough
+            table = query.get_final_froms()[0]
+            estimate = await db.scalar(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+                {"table": table.name},
+            )
+        else:
+            estimate = await _explain_rows(db, query)
+
+    # reltuples is -1 for tables that were never analyzed
+    if estimate is None or estimate < 0:
+        return await _exact_count(db, query)
+    return int(estimate)
+
+
+async def _cached_count(db: AsyncSession, query: Selectable) -> int:
+    key = hashlib.sha1(_render_query(db, query).encode()).hexdigest()
+    now = time.monotonic()
+
+    cached = _count_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    total = await _exact_count(db, query)
+
+    if len(_count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+        for cached_key, (expires_at, _) in list(_count_cache.items()):
+            if expires_at <= now:
+                del _count_cache[cached_key]
+        if len(_count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+            _count_cache.clear()
+
+    _count_cache[key] = (now + COUNT_CACHE_TTL, total)
+    return total
+
+
+async def count_query(
+    db: AsyncSession, query: Selectable, strategy: str = "exact"
+) -> Optional[int]:
+    """
+    Count the rows a filtered select would return.
+
+    :param db: The database session.
+    :param query: The filtered select, without ordering, offset and limit.
+    :param strategy: "exact" runs count(*), "estimated" uses the planner row estimate
+        (pg_class stats for unfiltered queries), "cached" keeps exact counts per
+        filter set for COUNT_CACHE_TTL seconds and "none" skips counting.
+    :return: The total number of rows, or None for the "none" strategy.
+    """
+    if strategy not in COUNT_STRATEGIES:
+        raise ValueError(f"Unknown count strategy: {strategy}")
+
+    if strategy == "none":
+        return None
+
+    try:
+        if strategy == "estimated":
+            return await _estimated_count(db, query)
+        if strategy == "cached":
+            return await _cached_count(db, query)
+    except Exception as e:
+        # Estimation is an optimization only, never fail a listing because of it
+        logging.error(f"{strategy} count failed, falling back to exact count: {e}")
+
+    return await _exact_count(db, query)
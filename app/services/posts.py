@@ -2,6 +2,7 @@ import re
 from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from crud.categories import crud_category, crud_subcategory
+from services.category_registry import category_registry
 from schemas.categories import (
     CreateCategorySchema,
     CategoryInfoSchema,
@@ -24,7 +25,9 @@ async def create_slug(title: str) -> str:
 async def is_subcategory_in_category(
     db: AsyncSession, category_id: int, sub_category_id: int
 ):
-    return await crud_subcategory.get(db, id=sub_category_id, category_id=category_id)
+    return await category_registry.get_subcategory(
+        db, id=sub_category_id, category_id=category_id
+    )
 
 
 async def perfome_create_category(
@@ -46,12 +49,12 @@ async def perfome_create_category(
             detail=f"A category slug is too long, max:128, yours is:{len(slug)}",
         )
 
-    if await crud_category.get(db, title=title):
+    if await category_registry.get_category(db, title=title):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="A category with this title already exists.",
         )
-    if await crud_category.get(db, slug=slug):
+    if await category_registry.get_category(db, slug=slug):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="A category with this slug already exists.",
@@ -63,6 +66,7 @@ async def perfome_create_category(
 
     # Create the new category and ensure it's returned as a model instance or dict
     new_category = await crud_category.create(db, obj_in=category_data)
+    await category_registry.bump_version(db)
 
     # Assuming new_category is an ORM model instance
     return CategoryInfoSchema(**new_category.dict())
@@ -87,18 +91,18 @@ async def perfome_create_subcategory(
             detail=f"slug is too long, max:128, yours is:{len(slug)}",
         )
 
-    if await crud_subcategory.get(db, title=title):
+    if await category_registry.get_subcategory(db, title=title):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="A category with this title already exists.",
         )
-    if await crud_subcategory.get(db, slug=slug):
+    if await category_registry.get_subcategory(db, slug=slug):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="This slug already exists.",
         )
 
-    category = await crud_category.get(
+    category = await category_registry.get_category(
         db, title=await clean_title(subcategory_data.category)
     )
     if not category:
@@ -117,6 +121,7 @@ async def perfome_create_subcategory(
 
     # Create the new SubCategory using the 'subcategory_data_dict'
     new_subcategory = await crud_subcategory.create(db, obj_in=subcategory_data_dict)
+    await category_registry.bump_version(db)
 
     # Construct the SubCategoryInfoSchema object with the category name included
     subcategory_info_data = new_subcategory.dict()
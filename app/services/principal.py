@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from configs.auth import (
+    PRINCIPAL_CACHE_MAX_ENTRIES,
+    PRINCIPAL_CACHE_REDIS,
+    PRINCIPAL_CACHE_TTL,
+)
+from schemas.users import PrincipalSchema
+from services.cache import get_redis
+
+PRINCIPAL_KEY_PREFIX = "principal"
+PRINCIPALS_CHANNEL = "principals:invalidated"
+
+# Bumped on every invalidation, the invalidated user's generation key records
+# the value. A principal loaded on a miss is only stored if its user wasn't
+# invalidated after the miss, the row may have been read before that write.
+_GENERATION_KEY = f"{PRINCIPAL_KEY_PREFIX}:generation"
+
+# KEYS: generation counter, user's generation key, user's entry. ARGV: TTL
+_INVALIDATE_SCRIPT = """
+local generation = redis.call('INCR', KEYS[1])
+redis.call('SET', KEYS[2], generation, 'EX', ARGV[1])
+redis.call('DEL', KEYS[3])
+return generation
+"""
+
+# KEYS: user's entry, user's generation key. ARGV: generation at the miss, principal, TTL
+_STORE_SCRIPT = """
+local generation = redis.call('GET', KEYS[2])
+if generation and tonumber(generation) > tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+# Fields the cached principals are made of, changing one of them invalidates the user's entry
+PRINCIPAL_FIELDS = ("username", "is_activated", "is_staff", "is_vip", "password")
+
+
+class PrincipalCache:
+    """
+    Principals of recently authenticated users, by user id.
+
+    A small LRU with TTL per process, optionally backed by redis so a user is
+    loaded from Postgres once for all processes. Writers call invalidate, which
+    drops the entry here and in redis and publishes the user id, every process
+    listening on the channel drops its local copy.
+
+    get returns the generation of the cache along with a miss, set doesn't store
+    the loaded principal if the user was invalidated since, so a miss racing a
+    write can't cache the row it read before the write.
+    """
+
+    def __init__(self, ttl: int, max_entries: int, use_redis: bool):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.use_redis = use_redis
+        self._entries: "OrderedDict[str, Tuple[float, PrincipalSchema]]" = OrderedDict()
+        # Bumped on every invalidation seen by this process, local or published
+        self._generation = 0
+
+    async def get(self, user_id: str) -> Tuple[Optional[PrincipalSchema], tuple]:
+        """
+        The cached principal of a user, None on a miss. The second value is the
+        generation to pass to set with the principal loaded after the miss.
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            expires_at, principal = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return principal, (self._generation, None)
+            del self._entries[user_id]
+
+        generation = self._generation
+        if not self.use_redis:
+            return None, (generation, None)
+
+        try:
+            cached, shared_generation = await get_redis().mget(self._key(user_id), _GENERATION_KEY)
+        except Exception as e:
+            logging.error(f"Principal cache read error: {e}")
+            return None, (generation, None)
+        if cached is None:
+            return None, (generation, int(shared_generation or 0))
+
+        principal = PrincipalSchema.model_validate_json(cached)
+        self._store(user_id, principal)
+        return principal, (generation, None)
+
+    async def set(self, principal: PrincipalSchema, generation: tuple):
+        """
+        Cache a principal loaded after a miss, unless its user was invalidated
+        after the miss returned `generation`.
+        """
+        user_id = str(principal.id)
+        local_generation, shared_generation = generation
+        if local_generation != self._generation:
+            return
+
+        # Without the shared generation a stale principal couldn't be detected
+        if self.use_redis and shared_generation is not None:
+            try:
+                stored = await get_redis().register_script(_STORE_SCRIPT)(
+                    keys=[self._key(user_id), self._generation_key(user_id)],
+                    args=[shared_generation, principal.model_dump_json(), self.ttl],
+                )
+            except Exception as e:
+                logging.error(f"Principal cache write error: {e}")
+            else:
+                if not stored:
+                    return
+
+        self._store(user_id, principal)
+
+    async def invalidate(self, user_id):
+        user_id = str(user_id)
+        self._entries.pop(user_id, None)
+        self._generation += 1
+        try:
+            redis = get_redis()
+            if self.use_redis:
+                await redis.register_script(_INVALIDATE_SCRIPT)(
+                    keys=[_GENERATION_KEY, self._generation_key(user_id), self._key(user_id)],
+                    args=[self.ttl],
+                )
+            await redis.publish(PRINCIPALS_CHANNEL, user_id)
+        except Exception as e:
+            logging.error(f"Principal cache invalidation error: {e}")
+
+    async def listen(self):
+        """
+        Drop the local entries other processes invalidate.
+        Runs until cancelled, reconnects on redis errors.
+        """
+        while True:
+            try:
+                async with get_redis().pubsub() as pubsub:
+                    await pubsub.subscribe(PRINCIPALS_CHANNEL)
+                    # Invalidations may have been missed while we weren't subscribed
+                    self._entries.clear()
+                    self._generation += 1
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._entries.pop(message["data"].decode(), None)
+                            self._generation += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Principal cache listener error: {e}")
+                await asyncio.sleep(5)
+
+    def _store(self, user_id: str, principal: PrincipalSchema):
+        self._entries[user_id] = (time.monotonic() + self.ttl, principal)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f"{PRINCIPAL_KEY_PREFIX}:{user_id}"
+
+    @staticmethod
+    def _generation_key(user_id: str) -> str:
+        return f"{_GENERATION_KEY}:{user_id}"
+
+
+principal_cache = PrincipalCache(
+    PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_REDIS
+)
@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from configs.auth import (
+    TOKEN_REVOCATION_BLOOM_BITS,
+    TOKEN_REVOCATION_BLOOM_HASHES,
+    TOKEN_REVOCATION_BLOOM_REBUILD,
+)
+from dependencies.db import async_session_maker
+from models.tokens import RevokedToken
+from services.cache import get_redis
+
+REVOKED_KEY_PREFIX = "revoked"
+REVOKED_CHANNEL = "tokens:revoked"
+REBUILD_BATCH_SIZE = 10000
+# Seconds before the first retry of a failed publish, doubled up to the max
+PUBLISH_RETRY_DELAY = 1
+PUBLISH_RETRY_MAX_DELAY = 60
+
+
+class BloomFilter:
+    """
+    Set membership without false negatives: "not in" is always right,
+    "in" may be wrong with a probability set by the size and number of hashes.
+    """
+
+    def __init__(self, bits: int, hashes: int):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray((bits + 7) // 8)
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+        # Double hashing, k positions out of two 64 bit hashes
+        return ((first + i * second) % self.bits for i in range(self.hashes))
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self._array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(
+            self._array[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+
+class TokenRevocations:
+    """
+    Revoked token ids.
+
+    revoked_tokens is the durable record, redis keeps a copy of each id that
+    expires with the token, and every process keeps a bloom filter of the ids.
+    Most tokens checked aren't revoked, the filter answers that from memory.
+    A possible hit is confirmed in redis and then in the table.
+
+    The filter is only trusted while the listener is subscribed to the
+    revocations channel, otherwise every check goes to redis / the table.
+    A revocation that couldn't be published is republished in the background
+    until every filter has been rebuilt, unless the process exits first.
+    """
+
+    def __init__(self, bits: int, hashes: int, rebuild_interval: int):
+        self.bits = bits
+        self.hashes = hashes
+        self.rebuild_interval = rebuild_interval
+        self._bloom = BloomFilter(bits, hashes)
+        self._synced = False
+        # Retries of failed publishes, referenced until done
+        self._publishing = set()
+
+    async def revoke(self, db: AsyncSession, jti: str, expires_at: Optional[datetime]):
+        await db.execute(
+            insert(RevokedToken)
+            .values(jti=jti, expires_at=expires_at, revoked_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=[RevokedToken.jti])
+        )
+        await db.commit()
+        self._bloom.add(jti)
+
+        try:
+            redis = get_redis()
+            if expires_at is None:
+                await redis.set(self._key(jti), 1)
+            else:
+                ttl = int((expires_at - datetime.utcnow()).total_seconds()) + 1
+                if ttl > 0:
+                    await redis.set(self._key(jti), 1, ex=ttl)
+        except Exception as e:
+            # Checks that get past the filters confirm it in the table
+            logging.error(f"Token revocation write error: {e}")
+
+        try:
+            await get_redis().publish(REVOKED_CHANNEL, jti)
+        except Exception as e:
+            # A process still subscribed trusts a filter without the id, so
+            # the message must get through before the filters are rebuilt
+            logging.error(f"Token revocation publish error: {e}")
+            task = asyncio.create_task(self._publish_later(jti, expires_at))
+            self._publishing.add(task)
+            task.add_done_callback(self._publishing.discard)
+
+    async def _publish_later(self, jti: str, expires_at: Optional[datetime]):
+        """
+        Retry publishing a revocation until it goes through, the token expires
+        or every filter has been rebuilt from the table since the revocation.
+        """
+        give_up_at = time.monotonic() + self.rebuild_interval
+        delay = PUBLISH_RETRY_DELAY
+        while time.monotonic() < give_up_at:
+            if expires_at is not None and expires_at <= datetime.utcnow():
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, PUBLISH_RETRY_MAX_DELAY)
+            try:
+                await get_redis().publish(REVOKED_CHANNEL, jti)
+                return
+            except Exception as e:
+                logging.error(f"Token revocation publish retry error: {e}")
+
+    async def is_revoked(self, db: AsyncSession, jti: str) -> bool:
+        if self._synced and jti not in self._bloom:
+            return False
+
+        try:
+            if await get_redis().exists(self._key(jti)):
+                return True
+        except Exception as e:
+            logging.error(f"Token revocation read error: {e}")
+
+        result = await db.execute(
+            select(RevokedToken.jti).filter(
+                RevokedToken.jti == jti,
+                or_(RevokedToken.expires_at.is_(None), RevokedToken.expires_at > datetime.utcnow()),
+            )
+        )
+        return result.scalar_one_or_none() is not None
+
+    async def listen(self):
+        """
+        Add the ids other processes revoke to the filter and rebuild it from
+        the table periodically. Runs until cancelled, reconnects on redis errors.
+        """
+        while True:
+            try:
+                async with get_redis().pubsub() as pubsub:
+                    await pubsub.subscribe(REVOKED_CHANNEL)
+                    # Subscribed first, revocations made during the rebuild arrive as messages
+                    await self._rebuild()
+                    rebuilt_at = time.monotonic()
+                    while True:
+                        message = await pubsub.get_message(
+                            ignore_subscribe_messages=True, timeout=1.0
+                        )
+                        if message is not None:
+                            self._bloom.add(message["data"].decode())
+                        if time.monotonic() - rebuilt_at > self.rebuild_interval:
+                            await self._rebuild()
+                            rebuilt_at = time.monotonic()
+            except asyncio.CancelledError:
+                self._synced = False
+                raise
+            except Exception as e:
+                self._synced = False
+                logging.error(f"Token revocations listener error: {e}")
+                await asyncio.sleep(5)
+
+    async def _rebuild(self):
+        """
+        Fill a new filter with the unexpired revocations, expired ones are dropped.
+        """
+        bloom = BloomFilter(self.bits, self.hashes)
+        async with async_session_maker() as session:
+            result = await session.stream_scalars(
+                select(RevokedToken.jti)
+                .filter(
+                    or_(
+                        RevokedToken.expires_at.is_(None),
+                        RevokedToken.expires_at > datetime.utcnow(),
+                    )
+                )
+                .execution_options(yield_per=REBUILD_BATCH_SIZE)
+            )
+            async for jti in result:
+                bloom.add(jti)
+
+        self._bloom = bloom
+        self._synced = True
+
+    @staticmethod
+    def _key(jti: str) -> str:
+        return f"{REVOKED_KEY_PREFIX}:{jti}"
+
+
+token_revocations = TokenRevocations(
+    TOKEN_REVOCATION_BLOOM_BITS, TOKEN_REVOCATION_BLOOM_HASHES, TOKEN_REVOCATION_BLOOM_REBUILD
+)
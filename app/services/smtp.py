@@ -0,0 +1,109 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+from typing import List, Optional, Sequence
+
+import aiosmtplib
+
+from configs.emails import (
+    EMAIL_HOST_PASSWORD,
+    EMAIL_HOST_USERNAME,
+    EMAIL_SMTP_POOL_IDLE_TIMEOUT,
+    EMAIL_SMTP_POOL_SIZE,
+    EMAIL_SMTP_PORT,
+    EMAIL_SMTP_SERVER,
+    EMAIL_SMTP_SSL,
+    EMAIL_SMTP_STARTTLS,
+    EMAIL_SMTP_TIMEOUT,
+    EMAIL_SMTP_VALIDATE_CERTS,
+)
+
+
+class SMTPPool:
+    """
+    Keeps up to `size` authenticated SMTP connections open and reuses them
+    across messages instead of connecting, STARTTLS-ing and logging in for
+    every email. At most `size` messages are sent at once.
+    """
+
+    def __init__(self, size: int, idle_timeout: float, **smtp_options):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.smtp_options = smtp_options
+        self._loop = None
+        self._slots = None
+        # (connection, monotonic time it was last used), most recent last
+        self._idle = []
+
+    def _bind_loop(self):
+        # Connections and the semaphore belong to the loop they were made on,
+        # code running on another loop (e.g. asyncio.run()) starts a fresh pool
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.size)
+            self._idle = []
+
+    @asynccontextmanager
+    async def connection(self):
+        self._bind_loop()
+        async with self._slots:
+            smtp = None
+            while self._idle and smtp is None:
+                candidate, last_used = self._idle.pop()
+                if (
+                    candidate.is_connected
+                    and time.monotonic() - last_used < self.idle_timeout
+                ):
+                    smtp = candidate
+                else:
+                    candidate.close()
+            if smtp is None:
+                smtp = aiosmtplib.SMTP(**self.smtp_options)
+                # Logs in as well when a username and password are set
+                await smtp.connect()
+
+            try:
+                yield smtp
+            except BaseException:
+                # The session may be mid transaction, don't hand it out again
+                smtp.close()
+                raise
+            self._idle.append((smtp, time.monotonic()))
+
+    async def send_message(self, message: EmailMessage):
+        try:
+            async with self.connection() as smtp:
+                return await smtp.send_message(message)
+        except aiosmtplib.SMTPServerDisconnected:
+            # The server dropped an idle connection, retry once on a new one
+            async with self.connection() as smtp:
+                return await smtp.send_message(message)
+
+    async def send_many(
+        self, messages: Sequence[EmailMessage]
+    ) -> List[Optional[Exception]]:
+        """
+        Send `messages` concurrently over the pool, returns the error of every
+        message, None for the ones that were sent.
+        """
+        results = await asyncio.gather(
+            *(self.send_message(message) for message in messages),
+            return_exceptions=True,
+        )
+        return [result if isinstance(result, Exception) else None for result in results]
+
+
+smtp_pool = SMTPPool(
+    size=EMAIL_SMTP_POOL_SIZE,
+    idle_timeout=EMAIL_SMTP_POOL_IDLE_TIMEOUT,
+    hostname=EMAIL_SMTP_SERVER,
+    port=EMAIL_SMTP_PORT,
+    username=EMAIL_HOST_USERNAME or None,
+    password=EMAIL_HOST_PASSWORD or None,
+    start_tls=EMAIL_SMTP_STARTTLS,
+    use_tls=EMAIL_SMTP_SSL,
+    validate_certs=EMAIL_SMTP_VALIDATE_CERTS,
+    timeout=EMAIL_SMTP_TIMEOUT,
+)
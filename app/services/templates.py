@@ -0,0 +1,76 @@
+import time
+from pathlib import Path
+from string import Formatter
+from typing import Dict, Tuple
+
+import aiofiles
+import aiofiles.os
+
+from configs.general import TEMPLATES_AUTO_RELOAD
+
+TEMPLATES_DIR = Path(__file__).parent.parent / "templates"
+
+_formatter = Formatter()
+
+
+class CompiledTemplate:
+    """
+    A str.format template split into its literal text and replacement fields
+    once, rendering only fills the fields in.
+    """
+
+    def __init__(self, source: str):
+        self.parts = list(_formatter.parse(source))
+
+    def render(self, **context) -> str:
+        chunks = []
+        for literal, field_name, format_spec, conversion in self.parts:
+            chunks.append(literal)
+            if field_name is None:
+                continue
+            value, _ = _formatter.get_field(field_name, (), context)
+            value = _formatter.convert_field(value, conversion)
+            chunks.append(_formatter.format_field(value, format_spec))
+        return "".join(chunks)
+
+
+class TemplateLoader:
+    """
+    Reads and compiles each template once. With auto_reload (dev) a template
+    is recompiled when its file's mtime changes, checked at most every
+    `check_interval` seconds.
+    """
+
+    def __init__(self, directory: Path, auto_reload: bool = False, check_interval: float = 1.0):
+        self.directory = directory
+        self.auto_reload = auto_reload
+        self.check_interval = check_interval
+        # name -> (mtime, monotonic time of the last mtime check, template)
+        self._cache: Dict[str, Tuple[float, float, CompiledTemplate]] = {}
+
+    async def _load(self, name: str) -> CompiledTemplate:
+        path = self.directory / name
+        mtime = (await aiofiles.os.stat(path)).st_mtime
+        async with aiofiles.open(path, mode="r") as file:
+            template = CompiledTemplate(await file.read())
+        self._cache[name] = (mtime, time.monotonic(), template)
+        return template
+
+    async def get(self, name: str) -> CompiledTemplate:
+        cached = self._cache.get(name)
+        if cached is None:
+            return await self._load(name)
+
+        mtime, checked_at, template = cached
+        if not self.auto_reload or time.monotonic() - checked_at < self.check_interval:
+            return template
+        if (await aiofiles.os.stat(self.directory / name)).st_mtime != mtime:
+            return await self._load(name)
+        self._cache[name] = (mtime, time.monotonic(), template)
+        return template
+
+    async def render(self, name: str, **context) -> str:
+        return (await self.get(name)).render(**context)
+
+
+templates = TemplateLoader(TEMPLATES_DIR, auto_reload=TEMPLATES_AUTO_RELOAD)
@@ -1,13 +1,14 @@
 from datetime import datetime, timedelta
+import hashlib
 import logging
+import uuid
 from typing import Optional
 from fastapi import HTTPException, status
 from jose import ExpiredSignatureError, JWTError, jwt
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from models.users import Users
 from schemas.tokens import TokenPayloadSchema, TokenSchema
-from models.tokens import BlacklistedToken
+from services.revocation import token_revocations
 from configs.auth import (
     SECRET,
     REFRESH_SECRET,
@@ -17,6 +18,17 @@ from configs.auth import (
 )
 
 
+def new_jti() -> str:
+    return uuid.uuid4().hex
+
+
+def token_jti(token: str, payload: dict) -> str:
+    """
+    Id a token is revoked by, tokens issued before jti existed use their sha256.
+    """
+    return payload.get("jti") or hashlib.sha256(token.encode()).hexdigest()
+
+
 async def create_jwt_tokens(user: Users) -> TokenSchema:
     token_payload = TokenPayloadSchema(
         user_id=str(user.id),
@@ -25,17 +37,17 @@ async def create_jwt_tokens(user: Users) -> TokenSchema:
         is_staff=user.is_staff,
     )
 
-    to_encode = token_payload.dict()
+    to_encode = token_payload.dict(exclude_none=True)
 
     access_token_expire = datetime.now() + timedelta(
         minutes=ACCESS_TOKEN_EXPIRE_MINUTES
     )
-    to_encode.update({"exp": access_token_expire.timestamp()})
+    to_encode.update({"exp": access_token_expire.timestamp(), "jti": new_jti()})
     encoded_access = jwt.encode(to_encode, SECRET, algorithm=ALGORITHM)
 
     refresh_token_expire = datetime.now() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     to_encode.update(
-        {"exp": refresh_token_expire.timestamp()}
+        {"exp": refresh_token_expire.timestamp(), "jti": new_jti()}
     )  # Ensure to use `.timestamp()`
     encoded_refresh = jwt.encode(to_encode, REFRESH_SECRET, algorithm=ALGORITHM)
 
@@ -67,11 +79,17 @@ async def verify_token(token: str, token_type: str) -> TokenPayloadSchema:
                     detail="Invalid token payload: missing username",
                 )
             return TokenPayloadSchema(
-                user_id=user_id, username=username, is_staff=is_staff
+                user_id=user_id,
+                username=username,
+                is_staff=is_staff,
+                jti=token_jti(token, payload),
+                exp=payload.get("exp"),
             )
 
         # If it's a refresh token, you might return a simpler payload
-        return TokenPayloadSchema(user_id=user_id)
+        return TokenPayloadSchema(
+            user_id=user_id, jti=token_jti(token, payload), exp=payload.get("exp")
+        )
 
     except ExpiredSignatureError:
         raise HTTPException(
@@ -86,21 +104,18 @@ async def verify_token(token: str, token_type: str) -> TokenPayloadSchema:
         )
 
 
-async def is_token_blacklisted(token: str, db: AsyncSession) -> bool:
-    result = await db.execute(
-        select(BlacklistedToken).filter(BlacklistedToken.token == token)
-    )
-    return result.scalars().first() is not None
+async def is_token_revoked(token_data: TokenPayloadSchema, db: AsyncSession) -> bool:
+    return await token_revocations.is_revoked(db, token_data.jti)
 
 
-async def blacklist_token(token: str, db: AsyncSession):
+async def revoke_token(token_data: TokenPayloadSchema, db: AsyncSession):
+    """
+    Revoke a verified token until it expires.
+    """
+    expires_at = datetime.utcfromtimestamp(token_data.exp) if token_data.exp else None
     try:
-        blacklisted_token = BlacklistedToken(
-            token=token, blacklisted_on=datetime.utcnow()
-        )
-        db.add(blacklisted_token)
-        await db.commit()
+        await token_revocations.revoke(db, token_data.jti, expires_at)
     except Exception as e:
         await db.rollback()
-        logging.error(f"Error blacklisting token: {e}")
+        logging.error(f"Error revoking token: {e}")
         raise
@@ -1,11 +1,47 @@
 from typing import Type, Dict, Any
-from sqlalchemy import select
+from sqlalchemy import func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 
 from re import match
 
 
+def _field_matches(model: Type, field_name: str, field_value: Any):
+    # Strings are compared case-insensitively, like the lower() unique indexes
+    column = getattr(model, field_name)
+    if isinstance(field_value, str):
+        return func.lower(column) == field_value.lower()
+    return column == field_value
+
+
+async def get_conflicting_fields(
+    db: AsyncSession, model: Type, fields_to_check: Dict[str, Any]
+) -> Dict[str, str]:
+    """
+    Asynchronously finds which of the given fields are already used, with a single query.
+
+    Returns:
+    - A dictionary of the conflicting field names and their error messages, empty if all are unique.
+    """
+    if not fields_to_check:
+        return {}
+
+    conditions = {
+        field_name: _field_matches(model, field_name, field_value)
+        for field_name, field_value in fields_to_check.items()
+    }
+    stmt = select(
+        *[func.bool_or(condition).label(field_name) for field_name, condition in conditions.items()]
+    ).filter(or_(*conditions.values()))
+    row = (await db.execute(stmt)).one()
+
+    return {
+        field_name: f"This {field_name} is already in use."
+        for field_name in fields_to_check
+        if getattr(row, field_name)
+    }
+
+
 async def is_unique(
     db: AsyncSession, model: Type, fields_to_check: Dict[str, Any]
 ) -> bool:
@@ -20,14 +56,7 @@ async def is_unique(
     Returns:
     - True if all fields are unique, otherwise raises an HTTPException with status code 400 and details of duplicates.
     """
-    errors = {}
-    for field_name, field_value in fields_to_check.items():
-        stmt = select(model).filter(getattr(model, field_name) == field_value)
-        result = await db.execute(stmt)
-        existing_record = result.scalars().first()
-        if existing_record:
-            # If the code reaches this point, a record exists, so add an error
-            errors[field_name] = f"This {field_name} is already in use."
+    errors = await get_conflicting_fields(db, model, fields_to_check)
 
     if errors:
         # If there are any errors, raise an HTTPException with the details
@@ -1,38 +1,31 @@
 import logging
 import traceback
-from .configs import celery_app
+from tasks.runtime import async_task, task_session
 from services.admin import generate_report
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
-import asyncio
-from db.db import DATABASE_URL
+from datetime import datetime
+from sqlalchemy import delete
+from models.tokens import RevokedToken
 
-AsyncSessionFactory = sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=create_async_engine(
-        DATABASE_URL,
-        echo=True,
-    ),
-    class_=AsyncSession,
-)
 
+@async_task(name="generate_report")
+async def generate_daily_report_task():
+    async with task_session() as session:
+        try:
+            await generate_report(session)
+        except Exception as e:
+            logging.error(f"Error generating daily report generating: {e}\n{traceback.format_exc()}")
 
-@celery_app.task(name="generate_report")
-def generate_daily_report_task():
-    async def task_with_db():
-        # Directly use the sessionmaker in the async context
-        async with AsyncSessionFactory() as session:
-            try:
-                result = await generate_report(session)
-                return result
-            except Exception as e:
-                 logging.error(f"Error generating daily report generating: {e}\n{traceback.format_exc()}")
 
-            finally:
-                await session.close()  # Ensure the session is closed
+@async_task(name="purge_revoked_tokens")
+async def purge_revoked_tokens() -> int:
+    """
+    Delete the revocations of tokens that have expired anyway.
+    """
+    async with task_session() as session:
+        result = await session.execute(
+            delete(RevokedToken).where(RevokedToken.expires_at < datetime.utcnow())
+        )
+        await session.commit()
 
-    try:
-        asyncio.run(task_with_db())
-    except Exception as e:
-        logging.critical(f"Error generating daily report task starting: {e}\n{traceback.format_exc()}")
+    logging.info(f"Purged {result.rowcount} expired token revocations")
+    return result.rowcount
@@ -2,20 +2,20 @@ from celery import Celery
 from celery.schedules import crontab
 
 from configs.db import REDIS_PORT, REDIS_HOST
+from configs.emails import EMAIL_OUTBOX_DISPATCH_INTERVAL
 
 celery_app = Celery(
     "tasks",
     broker=f"redis://{REDIS_HOST}:{REDIS_PORT}/0",
     backend=f"redis://{REDIS_HOST}:{REDIS_PORT}/0",
+    # Imported by the worker when it starts, not when this module is: the task
+    # modules import celery_app from here, and the API imports task modules
+    include=["tasks.admin", "tasks.store", "tasks.media", "tasks.emails"],
 )
 
 # Optional configuration, for example timezone
 celery_app.conf.update(timezone="UTC")
 
-# In your Celery app initialization module, ensure task discovery is correctly set up
-celery_app.autodiscover_tasks(["tasks.admin"], force=True)
-celery_app.autodiscover_tasks(["tasks.store"], force=True)
-
 
 celery_app.conf.beat_schedule = {
     "generate_daily_report": {
@@ -30,5 +30,21 @@ celery_app.conf.beat_schedule = {
         "task": "unvip_exited_users", 
         "schedule": crontab(hour="0"), 
     },
+    "purge_revoked_tokens": {
+        "task": "purge_revoked_tokens",
+        "schedule": crontab(hour=2, minute=0),
+    },
+    "sweep_orphan_media": {
+        "task": "sweep_orphan_media",
+        "schedule": crontab(hour=3, minute=30),
+    },
+    "purge_email_outbox": {
+        "task": "purge_email_outbox",
+        "schedule": crontab(hour=2, minute=30),
+    },
+    "dispatch_email_outbox": {
+        "task": "dispatch_email_outbox",
+        "schedule": EMAIL_OUTBOX_DISPATCH_INTERVAL,
+    },
 }
 
@@ -0,0 +1,103 @@
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from tasks.runtime import async_task, task_session
+from configs.emails import (
+    EMAIL_OUTBOX_BATCH_SIZE,
+    EMAIL_OUTBOX_MAX_ATTEMPTS,
+    EMAIL_OUTBOX_MAX_RETRY_DELAY,
+    EMAIL_OUTBOX_RETENTION_DAYS,
+    EMAIL_OUTBOX_RETRY_DELAY,
+)
+from models.emails import EmailOutbox
+from services.email import build_message
+from services.smtp import smtp_pool
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """
+    Exponential backoff before the next attempt of an email that failed `attempts` times.
+    """
+    return timedelta(
+        seconds=min(EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), EMAIL_OUTBOX_MAX_RETRY_DELAY)
+    )
+
+
+async def _dispatch_batch(session, batch_size: int, stats: dict) -> int:
+    """
+    Send one batch of due emails concurrently over the SMTP pool. The rows stay
+    locked until the commit, so concurrent dispatchers skip them instead of
+    sending them twice.
+    """
+    now = datetime.utcnow()
+    result = await session.execute(
+        select(EmailOutbox)
+        .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    emails = result.scalars().all()
+    errors = await smtp_pool.send_many(
+        [
+            build_message(email.recipient, email.subject, email.body, email.subtype)
+            for email in emails
+        ]
+    )
+
+    for email, error in zip(emails, errors):
+        email.attempts += 1
+        if error is not None:
+            email.last_error = str(error)
+            if email.attempts >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+                email.status = "failed"
+                stats["failed"] += 1
+                logging.error(f"Email {email.id} failed after {email.attempts} attempts: {error}")
+            else:
+                email.next_attempt_at = datetime.utcnow() + retry_delay(email.attempts)
+                stats["retried"] += 1
+        else:
+            email.status = "sent"
+            email.sent_at = datetime.utcnow()
+            # The body holds single use links (verification, password reset)
+            email.body = ""
+            stats["sent"] += 1
+
+    await session.commit()
+    return len(emails)
+
+
+@async_task(name="dispatch_email_outbox")
+async def dispatch_email_outbox(batch_size: int = EMAIL_OUTBOX_BATCH_SIZE) -> dict:
+    """
+    Send the due emails of the outbox, batch after batch until none is left.
+    Failed sends are retried with exponential backoff by a later run.
+    """
+    stats = {"sent": 0, "retried": 0, "failed": 0}
+    async with task_session() as session:
+        while await _dispatch_batch(session, batch_size, stats) == batch_size:
+            pass
+
+    if any(stats.values()):
+        logging.info(f"Email outbox dispatched: {stats}")
+    return stats
+
+
+@async_task(name="purge_email_outbox")
+async def purge_email_outbox() -> int:
+    """
+    Delete the sent and failed emails older than EMAIL_OUTBOX_RETENTION_DAYS,
+    failed ones still hold their rendered links until then.
+    """
+    async with task_session() as session:
+        result = await session.execute(
+            delete(EmailOutbox).where(
+                EmailOutbox.status.in_(("sent", "failed")),
+                EmailOutbox.created_at
+                < datetime.utcnow() - timedelta(days=EMAIL_OUTBOX_RETENTION_DAYS),
+            )
+        )
+        await session.commit()
+
+    logging.info(f"Purged {result.rowcount} sent and failed outbox emails")
+    return result.rowcount
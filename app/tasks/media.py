@@ -0,0 +1,424 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Tuple
+from sqlalchemy import delete, select, union_all
+from tasks.runtime import async_task, task_session
+from crud.images import crud_stored_image
+from models.images import StoredImage
+from models.posts import PostImage
+from models.users import Users
+from configs.general import (
+    AVATARS_DIR,
+    DEFAULT_AVATAR,
+    IMAGES_STORE_DIR,
+    MEDIA_REPROCESS_CHUNK_SIZE,
+    MEDIA_REPROCESS_WORKERS,
+    MEDIA_SWEEP_GRACE_PERIOD,
+    POSTS_PICTURES_DIR,
+    UPLOADS_STAGING_DIR,
+)
+from services.cache import get_redis, invalidate_tags, model_cache_tags
+from utils.images import (
+    content_dir,
+    file_sha256,
+    generate_variants,
+    content_hash_from_url,
+    media_path,
+    media_url,
+    original_path,
+    remove_image_files,
+    store_image_files,
+    stored_image_url,
+)
+
+MEDIA_MIGRATION_CHUNK_SIZE = 500
+# Last stored image hash regenerated by reprocess_images, the job resumes after it
+REPROCESS_CHECKPOINT_KEY = "media:reprocess:checkpoint"
+# Orphan candidates are re-checked and removed in batches of this size
+SWEEP_BATCH_SIZE = 500
+
+
+async def _migrate_model_media(session, model, chunk_size: int) -> dict:
+    """
+    Move the images of one model into the image store, `chunk_size` rows per commit.
+    """
+    store_url = media_url(IMAGES_STORE_DIR) + "/"
+    stats = {"moved": 0, "missing": 0}
+    last_id = None
+
+    while True:
+        query = (
+            select(model)
+            .where(~model.image.startswith(store_url), model.image != DEFAULT_AVATAR)
+            .order_by(model.id)
+            .limit(chunk_size)
+        )
+        if last_id is not None:
+            query = query.where(model.id > last_id)
+        rows = (await session.execute(query)).scalars().all()
+        if not rows:
+            return stats
+        last_id = rows[-1].id
+
+        legacy_paths, tags = [], []
+        for row in rows:
+            legacy_path = media_path(row.image)
+            if not os.path.exists(legacy_path):
+                logging.error(f"Media migration: {legacy_path} is missing, skipped")
+                stats["missing"] += 1
+                continue
+
+            content_hash = file_sha256(legacy_path)
+            stored = await crud_stored_image.get(session, hash=content_hash)
+            if stored is None:
+                extension = legacy_path.rsplit(".", 1)[-1].lower().replace("jpeg", "jpg")
+                image_url = store_image_files(legacy_path, content_hash, extension)
+            else:
+                image_url = stored.image
+
+            row.image = await crud_stored_image.acquire(
+                session, content_hash, image_url, commit=False
+            )
+            legacy_paths.append(legacy_path)
+            tags.extend(model_cache_tags(row, include_table=False))
+
+        await session.commit()
+        await invalidate_tags(tags)
+
+        # Legacy files are only removed once the rows point to the store
+        for legacy_path in legacy_paths:
+            os.remove(legacy_path)
+        stats["moved"] += len(legacy_paths)
+
+
+@async_task(name="migrate_legacy_media")
+async def migrate_legacy_media(chunk_size: int = MEDIA_MIGRATION_CHUNK_SIZE) -> dict:
+    """
+    One-off migration of the images saved under random names in the flat
+    posts/avatars directories into the content addressed, sharded image store.
+    Duplicated files are stored once, the migration can be re-run safely.
+    """
+
+    async with task_session() as session:
+        stats = {
+            model.__tablename__: await _migrate_model_media(session, model, chunk_size)
+            for model in (PostImage, Users)
+        }
+
+    logging.info(f"Media migration finished: {stats}")
+    return stats
+
+
+def _reprocess_image(content_hash: str) -> Tuple[str, Optional[str]]:
+    """
+    Regenerate the variants of a stored image from its original.
+    Runs in the pool processes, returns the hash and an error message if any.
+    """
+    source_path = original_path(content_hash)
+    if source_path is None:
+        return content_hash, "original is missing"
+    try:
+        generate_variants(source_path, content_dir(content_hash), content_hash)
+    except Exception as e:
+        return content_hash, str(e)
+    return content_hash, None
+
+
+async def _reprocess_stored_images(session, pool, chunk_size: int) -> dict:
+    stats = {"processed": 0, "failed": 0}
+    started_at = time.monotonic()
+    checkpoint = get_redis()
+    last_hash = await checkpoint.get(REPROCESS_CHECKPOINT_KEY)
+    if last_hash:
+        last_hash = last_hash.decode()
+        logging.info(f"Image reprocessing resumes after {last_hash}")
+
+    loop = asyncio.get_running_loop()
+    while True:
+        query = select(StoredImage.hash).order_by(StoredImage.hash).limit(chunk_size)
+        if last_hash:
+            query = query.where(StoredImage.hash > last_hash)
+        hashes = (await session.execute(query)).scalars().all()
+        if not hashes:
+            break
+
+        results = await asyncio.gather(
+            *(loop.run_in_executor(pool, _reprocess_image, content_hash) for content_hash in hashes)
+        )
+        for content_hash, error in results:
+            if error:
+                logging.error(f"Image reprocessing failed for {content_hash}: {error}")
+                stats["failed"] += 1
+            else:
+                stats["processed"] += 1
+
+        # Every image of the chunk is done, a crash from now on restarts after it
+        last_hash = hashes[-1]
+        await checkpoint.set(REPROCESS_CHECKPOINT_KEY, last_hash)
+
+        done = stats["processed"] + stats["failed"]
+        logging.info(
+            f"Image reprocessing: {done} images, "
+            f"{done / max(time.monotonic() - started_at, 1e-6):.1f} images/sec"
+        )
+
+    await checkpoint.delete(REPROCESS_CHECKPOINT_KEY)
+    elapsed = max(time.monotonic() - started_at, 1e-6)
+    stats["seconds"] = round(elapsed, 1)
+    stats["images_per_second"] = round((stats["processed"] + stats["failed"]) / elapsed, 1)
+    return stats
+
+
+@async_task(name="reprocess_images")
+async def reprocess_images(
+    chunk_size: int = MEDIA_REPROCESS_CHUNK_SIZE,
+    workers: int = MEDIA_REPROCESS_WORKERS,
+    restart: bool = False,
+) -> dict:
+    """
+    Regenerate the variants of every stored image from its original, e.g. after
+    IMAGE_VARIANTS or IMAGE_FORMATS changed. Images are walked in chunks by hash,
+    decoded and resized across a process pool, and the last finished chunk is
+    checkpointed in redis so an interrupted run continues where it stopped.
+
+    Posts and avatars share stored images, each content is processed once.
+    Images still outside the store have no original, run migrate_legacy_media first.
+    """
+    # Prefork workers are daemonic and can't start child processes, threads are
+    # used there instead (Pillow releases the GIL while decoding and resizing).
+    # The command line has no such limit.
+    if multiprocessing.current_process().daemon:
+        logging.warning("Image reprocessing runs in a daemonic worker, using threads instead of processes")
+        pool = ThreadPoolExecutor(max_workers=workers)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+
+    try:
+        if restart:
+            await get_redis().delete(REPROCESS_CHECKPOINT_KEY)
+        async with task_session() as session:
+            stats = await _reprocess_stored_images(session, pool, chunk_size)
+        logging.info(f"Image reprocessing finished: {stats}")
+        return stats
+    finally:
+        pool.shutdown()
+
+
+@async_task(name="remove_media_files")
+async def remove_media_files(urls: List[str]):
+    """
+    Remove the files of released images, see services.images.release_images.
+    Stored content referenced again since it was released is kept.
+    """
+    restored = set()
+    hashes = {content_hash_from_url(url) for url in urls} - {None}
+    if hashes:
+        async with task_session() as session:
+            result = await session.execute(
+                select(StoredImage.hash).where(StoredImage.hash.in_(hashes))
+            )
+            restored = set(result.scalars().all())
+
+    for url in urls:
+        if content_hash_from_url(url) not in restored:
+            remove_image_files(url)
+
+
+def _stored_images_on_disk() -> Iterator[Tuple[str, List[str]]]:
+    """
+    (hash, paths) of every image in the store, in hash order.
+    Only one leaf directory is listed at a time.
+    """
+    for first in sorted(os.listdir(IMAGES_STORE_DIR)):
+        first_dir = os.path.join(IMAGES_STORE_DIR, first)
+        if not os.path.isdir(first_dir):
+            continue
+        for second in sorted(os.listdir(first_dir)):
+            files = defaultdict(list)
+            with os.scandir(os.path.join(first_dir, second)) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        files[entry.name.split("_", 1)[0]].append(entry.path)
+            for content_hash in sorted(files):
+                yield content_hash, files[content_hash]
+
+
+def _legacy_images_on_disk(directory: str) -> Iterator[Tuple[str, List[str]]]:
+    """
+    (url, [path]) of every file of a flat media directory, in url order.
+    """
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and media_url(path) != DEFAULT_AVATAR:
+            yield media_url(path), [path]
+
+
+async def _referenced_images(session, prefix: str) -> AsyncIterator[str]:
+    """
+    Every postimages.image / users.image url starting with `prefix`, streamed
+    from a server side cursor in byte order (the order Python sorts str in).
+    """
+    references = union_all(
+        select(PostImage.image.label("image")).where(PostImage.image.startswith(prefix)),
+        select(Users.image.label("image")).where(Users.image.startswith(prefix)),
+    ).subquery()
+    result = await session.stream(
+        select(references.c.image)
+        .order_by(references.c.image.collate("C"))
+        .execution_options(yield_per=SWEEP_BATCH_SIZE)
+    )
+    async for image in result.scalars():
+        yield image
+
+
+async def _unreferenced_on_disk(
+    session,
+    prefix: str,
+    on_disk: Iterator[Tuple[str, List[str]]],
+    key: Callable[[str], str],
+) -> AsyncIterator[Tuple[str, List[str]]]:
+    """
+    Merge the sorted files on disk with the sorted references, yielding the
+    (key, paths) nobody references. Neither side is loaded in memory.
+    """
+    references = _referenced_images(session, prefix)
+    reference = await anext(references, None)
+
+    for file_key, paths in on_disk:
+        while reference is not None and key(reference) < file_key:
+            reference = await anext(references, None)
+        if reference is None or key(reference) != file_key:
+            yield file_key, paths
+
+
+async def _confirm_unreferenced(session, urls: List[str]) -> set:
+    """
+    Re-check orphan candidates right before removing them, they may have been
+    referenced since the streaming pass read that part of the tables.
+    """
+    result = await session.execute(
+        union_all(
+            select(PostImage.image).where(PostImage.image.in_(urls)),
+            select(Users.image).where(Users.image.in_(urls)),
+        )
+    )
+    return set(urls) - set(result.scalars().all())
+
+
+async def _sweep(session, prefix, on_disk, key, to_url, stored: bool, dry_run: bool) -> dict:
+    stats = {"orphans": 0, "files": 0}
+    expired_before = time.time() - MEDIA_SWEEP_GRACE_PERIOD
+    batch = {}
+
+    async def remove_batch():
+        unreferenced = await _confirm_unreferenced(session, list(batch))
+        if stored and unreferenced and not dry_run:
+            # The refcount of content whose rows were removed by ON DELETE CASCADE
+            await session.execute(
+                delete(StoredImage).where(
+                    StoredImage.hash.in_([content_hash_from_url(url) for url in unreferenced])
+                )
+            )
+            await session.commit()
+        for url in unreferenced:
+            stats["orphans"] += 1
+            stats["files"] += len(batch[url])
+            if not dry_run:
+                for path in batch[url]:
+                    os.remove(path)
+        batch.clear()
+
+    # The merge keeps its server side cursor open, candidates are re-checked
+    # through a second session
+    async with task_session() as stream_session:
+        async for file_key, paths in _unreferenced_on_disk(stream_session, prefix, on_disk, key):
+            if any(os.path.getmtime(path) > expired_before for path in paths):
+                continue
+            batch[to_url(file_key)] = paths
+            if len(batch) >= SWEEP_BATCH_SIZE:
+                await remove_batch()
+        if batch:
+            await remove_batch()
+
+    return stats
+
+
+@async_task(name="sweep_orphan_media")
+async def sweep_orphan_media(dry_run: bool = False) -> dict:
+    """
+    Remove media files no postimages / users row references anymore, e.g. the
+    images of posts and users removed by ON DELETE CASCADE.
+
+    The files of each media directory and the references to it are both walked
+    in sorted order and merged, so memory doesn't grow with the number of images.
+    Files younger than MEDIA_SWEEP_GRACE_PERIOD are kept, so are abandoned
+    staged uploads until they get that old.
+    """
+
+    stats = {}
+    async with task_session() as session:
+        stats["images"] = await _sweep(
+            session,
+            media_url(IMAGES_STORE_DIR) + "/",
+            _stored_images_on_disk(),
+            content_hash_from_url,
+            stored_image_url,
+            stored=True,
+            dry_run=dry_run,
+        )
+        for directory in (POSTS_PICTURES_DIR, AVATARS_DIR):
+            stats[os.path.basename(os.path.normpath(directory))] = await _sweep(
+                session,
+                media_url(directory) + "/",
+                _legacy_images_on_disk(directory),
+                lambda url: url,
+                lambda url: url,
+                stored=False,
+                dry_run=dry_run,
+            )
+
+    stats["staging"] = {"files": 0}
+    expired_before = time.time() - MEDIA_SWEEP_GRACE_PERIOD
+    if os.path.isdir(UPLOADS_STAGING_DIR):
+        with os.scandir(UPLOADS_STAGING_DIR) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.stat().st_mtime < expired_before:
+                    stats["staging"]["files"] += 1
+                    if not dry_run:
+                        os.remove(entry.path)
+
+    logging.info(f"Orphan media sweep finished{' (dry run)' if dry_run else ''}: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Image store maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser("migrate", help="move legacy images into the image store")
+    migrate.add_argument("--chunk-size", type=int, default=MEDIA_MIGRATION_CHUNK_SIZE)
+
+    reprocess = commands.add_parser("reprocess", help="regenerate the variants of stored images")
+    reprocess.add_argument("--chunk-size", type=int, default=MEDIA_REPROCESS_CHUNK_SIZE)
+    reprocess.add_argument("--workers", type=int, default=MEDIA_REPROCESS_WORKERS)
+    reprocess.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+
+    sweep = commands.add_parser("sweep", help="remove media files nothing references")
+    sweep.add_argument("--dry-run", action="store_true", help="only count the orphan files")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "migrate":
+        print(migrate_legacy_media(chunk_size=args.chunk_size))
+    elif args.command == "reprocess":
+        print(reprocess_images(chunk_size=args.chunk_size, workers=args.workers, restart=args.restart))
+    else:
+        print(sweep_orphan_media(dry_run=args.dry_run))
@@ -0,0 +1,134 @@
+import asyncio
+import functools
+import logging
+import traceback
+from typing import Optional
+
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from configs.db import CELERY_DB_ECHO, CELERY_DB_MAX_OVERFLOW
+from db.db import DATABASE_URL
+from services import cache
+# Only the app: tasks.configs must not import the task modules, which import
+# this module back (the worker imports them through its include setting)
+from tasks.configs import celery_app
+
+# Per worker process: one event loop every task runs on, and one engine whose
+# pooled connections belong to that loop. Both are created lazily in the
+# process using them, never inherited through the prefork fork.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker] = None
+
+# Pools running one task at a time per process. Thread and green thread pools
+# would drive the shared loop from several tasks at once, which
+# run_until_complete refuses ("This event loop is already running").
+SUPPORTED_POOLS = ("prefork", "processes", "solo")
+
+
+@worker_init.connect
+def _check_worker_pool(sender=None, **kwargs):
+    pool = getattr(sender, "pool_cls", None)
+    # The -P alias at this point, or a pool class given in the configuration
+    name = pool if isinstance(pool, str) else getattr(pool, "__module__", "").rsplit(".", 1)[-1]
+    if name not in SUPPORTED_POOLS:
+        # Exceptions raised by signal handlers are only logged, SystemExit isn't caught
+        raise SystemExit(
+            f"The {name or pool} worker pool isn't supported, run the worker with -P prefork or -P solo"
+        )
+
+
+@worker_process_init.connect
+def _init_worker_process(**kwargs):
+    """
+    A prefork child must not reuse the loop, connections or redis client of the parent.
+    """
+    global _loop, _engine, _session_factory
+    _loop = None
+    _engine = None
+    _session_factory = None
+    # Dropped, not closed, the socket is still the parent's
+    cache._redis = None
+
+
+@worker_process_shutdown.connect
+def _shutdown_worker_process(**kwargs):
+    if _loop is None or _loop.is_closed():
+        return
+    try:
+        if _engine is not None:
+            _loop.run_until_complete(_engine.dispose())
+        _loop.run_until_complete(cache.close_redis())
+    except Exception as e:
+        logging.error(f"Error closing the worker process connections: {e}")
+    finally:
+        _loop.close()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def get_engine() -> AsyncEngine:
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(
+            DATABASE_URL,
+            echo=CELERY_DB_ECHO,
+            # The process runs one task at a time, see SUPPORTED_POOLS
+            pool_size=1,
+            max_overflow=CELERY_DB_MAX_OVERFLOW,
+            # Connections idle between beat runs may have been closed by the server
+            pool_pre_ping=True,
+        )
+    return _engine
+
+
+def task_session() -> AsyncSession:
+    """
+    New session on the worker process' engine. Objects stay usable after a
+    commit, tasks read them (e.g. for cache tags) once the session is done.
+    """
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = async_sessionmaker(get_engine(), expire_on_commit=False)
+    return _session_factory()
+
+
+def run_async(coro):
+    """
+    Run a coroutine to completion on the worker process' loop.
+    """
+    return get_loop().run_until_complete(coro)
+
+
+def async_task(**options):
+    """
+    celery_app.task for coroutine functions, run on the worker process' loop.
+    Errors are logged and re-raised so the task is marked as failed.
+    """
+
+    def decorator(func):
+        name = options.get("name", func.__name__)
+
+        @functools.wraps(func)
+        def run_task(*args, **kwargs):
+            try:
+                return run_async(func(*args, **kwargs))
+            except Exception as e:
+                logging.critical(f"Error in task {name}: {e}\n{traceback.format_exc()}")
+                raise
+
+        return celery_app.task(**options)(run_task)
+
+    return decorator
@@ -1,86 +1,78 @@
-import asyncio
 import logging
-import os
-import secrets
-import traceback
-from PIL import Image
-from tasks.admin import AsyncSessionFactory
-from tasks.configs import celery_app
-from crud.posts import crud_post
+import time
+from tasks.runtime import async_task, task_session
+from crud.posts import crud_post, crud_postimage
 from crud.users import crud_user
-from datetime import datetime
+from schemas.posts import PostImageUpdate
+from services.images import release_images, store_staged_image
+from utils.images import log_peak_memory
+from datetime import date, timedelta
+from configs.general import VIP_DURATION_DAYS
 
-@celery_app.task
-def upload_picture(file_content: bytes, filename: str, dir: str):
-    extension = filename.split(".")[-1].lower()
-    if extension not in ["jpg", "png"]:
-        return "File extension must be .jpg or .png"
 
-    token_name = secrets.token_hex(10) + "." + extension
-    generated_name = os.path.join(dir, token_name)
+@async_task(name="process_post_picture")
+async def process_post_picture(
+    staged_path: str, content_hash: str, post_id: str, position: int = 0
+) -> str:
+    """
+    Store a staged post image and save its PostImage row.
+    Staged files are named after their sniffed format, see utils.uploads.stage_upload.
+    """
+    with log_peak_memory(f"process_post_picture {content_hash}"):
+        async with task_session() as session:
+            file_url = await store_staged_image(session, staged_path, content_hash)
+            await crud_postimage.create(
+                session,
+                obj_in=PostImageUpdate(post=post_id, image=file_url, position=position),
+            )
+            return file_url
 
-    # Save the file
-    try:
-        with open(generated_name, "wb") as out_file:
-            out_file.write(file_content)
-    except Exception as e:
-        return f"Error saving file: {str(e)}"
 
-    # Process the image
-    try:
-        with Image.open(generated_name) as img:
-            img = img.resize((512, 512))
-            img.save(generated_name)
-    except Exception as e:
-        return f"Error processing image: {str(e)}"
+@async_task(name="process_avatar_picture")
+async def process_avatar_picture(staged_path: str, content_hash: str, user_id: str) -> str:
+    """
+    Store a staged avatar, set it as the user's image and release the previous one.
+    """
+    with log_peak_memory(f"process_avatar_picture {content_hash}"):
+        async with task_session() as session:
+            file_url = await store_staged_image(session, staged_path, content_hash)
+            user = await crud_user.get(session, id=user_id)
+            previous_image = user.image
+            await crud_user.update(session, db_obj=user, obj_in={"image": file_url})
+            await release_images(session, [previous_image])
+            return file_url
 
-    # Assume all paths involve 'static/' for simplicity
-    file_url = generated_name.split("static/")[1]
-    return file_url
 
+@async_task(name="update_post_vip_from_user_vip")
+async def update_product_vip_task() -> int:
+    """
+    Propagate the owners' VIP status to their posts, see CRUDPost.sync_vip_with_owners.
+    """
+    started = time.perf_counter()
+    async with task_session() as session:
+        updated = len(await crud_post.sync_vip_with_owners(session))
 
-@celery_app.task(name='update_post_vip_from_user_vip')
-def update_product_vip_task():
-    async def update_product_vip():
-        async with AsyncSessionFactory() as session:
-            try:
-                users = await crud_user.get_multi(session)
-                
-                for user in users:
-                    posts = await crud_post.get_multi_filtered(session, owner=user.id)
-                    
-                    for post in posts:
-                        await crud_post.update(session, obj_in={'is_vip': user.is_vip})
-            except Exception as e:
-                logging.error(f"Error during post vip status changing: {e}\n{traceback.format_exc()}")
-            finally:
-                await session.close()  # Ensure the session is closed
-        try:
-            asyncio.run(update_product_vip())
-        except Exception as e:
-                logging.critical(f"Error during post vip status chanching task starting: {e}\n{traceback.format_exc()}")
+    logging.info(
+        f"Synced the VIP status of {updated} posts in {time.perf_counter() - started:.3f}s"
+    )
+    return updated
 
 
+@async_task(name="unvip_exited_users")
+async def unvip_exited_users() -> dict:
+    """
+    Drop the VIP status of users whose VIP_DURATION_DAYS have passed, and of
+    their posts right away instead of at the next update_post_vip_from_user_vip run.
+    """
+    started = time.perf_counter()
+    async with task_session() as session:
+        viped_before = date.today() - timedelta(days=VIP_DURATION_DAYS)
+        users = await crud_user.expire_vips(session, viped_before)
+        posts = await crud_post.sync_vip_with_owners(session) if users else []
+    stats = {"users": len(users), "posts": len(posts)}
 
-@celery_app.task(name='unvip_exited_users')
-def unvip_exited_users():
-    async def perfom_unvip():
-        async with AsyncSessionFactory() as session:
-            try:
-                users = await crud_user.get_multi_filtered(session, is_vip=True)
-                
-                for user in users:
-                    
-                    if user.viped_at <  datetime.today():
-                    
-                        await crud_user.update(session, obj_in={'is_vip': True,
-                                                                'viped_at': None })
-                       
-            except Exception as e:
-                logging.error(f"Error during unviping: {e}\n{traceback.format_exc()}")
-            finally:
-                await session.close()  # Ensure the session is closed
-    try:
-        asyncio.run(perfom_unvip())
-    except Exception as e:
-        logging.critical(f"Error during unviping task starting: {e}\n{traceback.format_exc()}")
+    logging.info(
+        f"Expired the VIP status of {stats['users']} users and {stats['posts']} posts "
+        f"in {time.perf_counter() - started:.3f}s"
+    )
+    return stats
@@ -3,6 +3,8 @@ from pathlib import Path
 
 import aiofiles
 
+from services.templates import templates
+
 
 async def calculate_percentage_change(old_value, new_value):
     new_value = int(new_value)
@@ -23,13 +25,10 @@ async def calculate_percentage_change(old_value, new_value):
 
 async def generate_report_file(report_data: dict):
     root = Path(__file__).parent.parent
-    template_path = root / "templates" / "report.html"
-
-    async with aiofiles.open(template_path, mode="r") as file:
-        template_content = await file.read()
 
-    # Using string's format method to substitute placeholders with actual values
-    filled_html = template_content.format(
+    # Substitute the placeholders of the compiled template with actual values
+    filled_html = await templates.render(
+        "report.html",
         report_date=date.today().isoformat(),
         total_users=report_data.get("total_users", "N/A"),
         total_activated=report_data.get("total_activated", "N/A"),
@@ -0,0 +1,277 @@
+import glob
+import hashlib
+import logging
+import math
+import os
+import resource
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from configs.general import (
+    DEFAULT_AVATAR,
+    IMAGES_STORE_DIR,
+    MAX_IMAGE_PIXELS,
+    STATIC_FILES_PATH,
+)
+
+# Pillow's own guard warns above the limit and only fails above twice it,
+# image_pixels / generate_variants reject anything above it
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Variant name -> max width/height in pixels, aspect ratio is kept
+IMAGE_VARIANTS = {
+    "thumbnail": 160,
+    "card": 480,
+    "full": 1280,
+}
+
+# Extension -> (Pillow format, save options), every variant is saved in each format
+IMAGE_FORMATS = {
+    "jpg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+}
+
+# Format stored in the database (PostImage.image / Users.image) for each image
+DEFAULT_VARIANT = "full"
+DEFAULT_EXTENSION = "jpg"
+
+# The upload is kept next to its variants, so they can be regenerated from it
+ORIGINAL_VARIANT = "original"
+ORIGINAL_EXTENSIONS = ("jpg", "png")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Reduced decoding stops at this multiple of the largest variant, the final
+# resize is still a LANCZOS one from at least twice the target resolution
+REDUCING_GAP = 2.0
+
+
+def variant_file_name(name: str, variant: str, extension: str) -> str:
+    return f"{name}_{variant}.{extension}"
+
+
+def variant_url(image_url: str, variant: str, extension: str = DEFAULT_EXTENSION) -> str:
+    """
+    Url of another variant of a stored image.
+
+    Images stored before variants existed have a single file, its url is
+    returned for every variant.
+    """
+    suffix = f"_{DEFAULT_VARIANT}.{DEFAULT_EXTENSION}"
+    if not image_url.endswith(suffix):
+        return image_url
+    return variant_file_name(image_url[: -len(suffix)], variant, extension)
+
+
+def image_variant_urls(
+    image_url: str, variants: Iterable[str] = IMAGE_VARIANTS
+) -> Dict[str, Dict[str, str]]:
+    """
+    {variant: {"jpeg": url, "webp": url}} for a stored image url.
+    """
+    return {
+        variant: {
+            "jpeg": variant_url(image_url, variant, "jpg"),
+            "webp": variant_url(image_url, variant, "webp"),
+        }
+        for variant in variants
+    }
+
+
+class ImageTooLargeError(ValueError):
+    pass
+
+
+def image_pixels(path: str) -> Tuple[int, int]:
+    """
+    Size of an image, only its header is read.
+    Raises ImageTooLargeError above MAX_IMAGE_PIXELS and ValueError for files
+    that aren't images.
+    """
+    try:
+        with Image.open(path) as img:
+            size = img.size
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    except Image.UnidentifiedImageError as e:
+        raise ValueError(str(e))
+
+    if size[0] * size[1] > MAX_IMAGE_PIXELS:
+        raise ImageTooLargeError(f"Image is too large, max is {MAX_IMAGE_PIXELS} pixels")
+    return size
+
+
+def _decode_reduced(source: Image.Image, max_side: int) -> Image.Image:
+    """
+    Decode an image at the lowest resolution still REDUCING_GAP times larger
+    than `max_side`. JPEGs are decoded at 1/2, 1/4 or 1/8 scale by libjpeg
+    (draft mode) so the full size bitmap never exists, other formats are
+    decoded fully and shrunk right away with a cheap box reduce.
+    """
+    target = max_side * REDUCING_GAP
+    scale = target / max(source.size)
+    if scale < 1 and source.format == "JPEG":
+        source.draft(None, (math.ceil(source.width * scale), math.ceil(source.height * scale)))
+
+    source.load()
+    factor = int(max(source.size) / target)
+    if factor < 2:
+        return source
+    if source.mode not in ("L", "LA", "RGB", "RGBA"):
+        # reduce doesn't handle palette or bilevel images
+        source = source.convert("RGBA" if source.mode in ("P", "PA") else "RGB")
+    return source.reduce(factor)
+
+
+@contextmanager
+def log_peak_memory(label: str):
+    """
+    Log the duration and the peak resident memory of the process around a block.
+    The peak is a process wide high-water mark, the growth shows what the block added to it.
+    """
+    started_at = time.monotonic()
+    peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        yield
+    finally:
+        # ru_maxrss is in kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        logging.info(
+            f"{label}: {time.monotonic() - started_at:.2f}s, "
+            f"peak memory {peak / 1024:.1f} MB (+{(peak - peak_before) / 1024:.1f} MB)"
+        )
+
+
+def generate_variants(source_path: str, dest_dir: str, name: str) -> str:
+    """
+    Save every variant of an image in every format, returns the path of the default one.
+
+    EXIF metadata isn't copied, the orientation it describes is applied to the pixels first.
+    Large sources are decoded at reduced resolution, see _decode_reduced.
+    """
+    image_pixels(source_path)
+
+    with Image.open(source_path) as source:
+        # The reduced copy keeps the source info, EXIF orientation included
+        img = ImageOps.exif_transpose(_decode_reduced(source, max(IMAGE_VARIANTS.values())))
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+
+    # Largest variant first, each smaller one is resized from the previous result
+    for variant, max_side in sorted(IMAGE_VARIANTS.items(), key=lambda item: -item[1]):
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        for extension, (image_format, options) in IMAGE_FORMATS.items():
+            img.save(
+                os.path.join(dest_dir, variant_file_name(name, variant, extension)),
+                image_format,
+                **options,
+            )
+
+    return os.path.join(dest_dir, variant_file_name(name, DEFAULT_VARIANT, DEFAULT_EXTENSION))
+
+
+def media_url(path: str) -> str:
+    """
+    Url of a file under the static files dir, as stored in the database.
+    """
+    return os.path.relpath(path, STATIC_FILES_PATH).replace(os.sep, "/")
+
+
+def media_path(url: str) -> str:
+    return os.path.join(STATIC_FILES_PATH, url)
+
+
+def content_dir(content_hash: str) -> str:
+    """
+    Two level sharded directory of a stored image, e.g. images/ab/cd/ for abcd...
+    """
+    return os.path.join(IMAGES_STORE_DIR, content_hash[:2], content_hash[2:4])
+
+
+def stored_image_url(content_hash: str) -> str:
+    """
+    Url of the default variant of a stored image, what the database references.
+    """
+    return media_url(
+        os.path.join(
+            content_dir(content_hash),
+            variant_file_name(content_hash, DEFAULT_VARIANT, DEFAULT_EXTENSION),
+        )
+    )
+
+
+def content_hash_from_url(url: str) -> Optional[str]:
+    """
+    sha256 of a stored image from one of its urls, None for images outside the store.
+    """
+    if not url or not url.startswith(media_url(IMAGES_STORE_DIR) + "/"):
+        return None
+    return url.rsplit("/", 1)[-1].split("_", 1)[0]
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def original_path(content_hash: str) -> Optional[str]:
+    for extension in ORIGINAL_EXTENSIONS:
+        path = os.path.join(
+            content_dir(content_hash),
+            variant_file_name(content_hash, ORIGINAL_VARIANT, extension),
+        )
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def store_image_files(source_path: str, content_hash: str, extension: str) -> str:
+    """
+    Generate the variants of an image into the content addressed store and keep
+    a copy of the source as the original. Returns the url of the default variant.
+    The source file is left in place.
+    """
+    if extension not in ORIGINAL_EXTENSIONS:
+        raise ValueError("File extension must be .jpg or .png")
+
+    dest_dir = content_dir(content_hash)
+    os.makedirs(dest_dir, exist_ok=True)
+
+    generated_name = generate_variants(source_path, dest_dir, content_hash)
+    shutil.copyfile(
+        source_path,
+        os.path.join(dest_dir, variant_file_name(content_hash, ORIGINAL_VARIANT, extension)),
+    )
+    return media_url(generated_name)
+
+
+def remove_image_files(url: str):
+    """
+    Remove every file of an image: all variants and the original for stored
+    images, the single file for images saved before the store existed.
+    """
+    content_hash = content_hash_from_url(url)
+    if content_hash:
+        paths = glob.glob(os.path.join(content_dir(content_hash), f"{content_hash}_*"))
+    elif url and url != DEFAULT_AVATAR:
+        paths = [media_path(url)]
+    else:
+        paths = []
+
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -1,11 +1,22 @@
+from collections import defaultdict
+from typing import List, Tuple
+
 from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
 
-from schemas.posts import PostImageInfo
+from schemas.posts import PostImageInfo, PostImageUpdate
 from schemas.users import UserDataSchema
 from crud.users import crud_user
-from crud.categories import crud_subcategory, crud_category
+from crud.images import crud_stored_image
+from services.category_registry import category_registry
+from services.images import store_staged_image
 from configs.general import POSTS_LIMIT, VIPS_POSTS_LIMIT
 from crud.posts import crud_postimage, crud_post
+from tasks.store import process_post_picture
+from utils.images import IMAGE_VARIANTS, image_variant_urls, variant_url
+
+# Listings only show small cards, so they only get the thumbnail urls
+LISTING_IMAGE_VARIANTS = ("thumbnail",)
 
 
 async def validate_post_create_data(post_data, category, subcategory) -> bool:
@@ -53,13 +64,13 @@ async def check_user_posts_limits(db, owner):
 async def validate_and_transform_category_subcategory(
     db, category_title, subcategory_title
 ):
-    category = await crud_category.get(db, title=category_title)
+    category = await category_registry.get_category(db, title=category_title)
     if not category:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Category not found"
         )
 
-    subcategory = await crud_subcategory.get(db, title=subcategory_title)
+    subcategory = await category_registry.get_subcategory(db, title=subcategory_title)
     if not subcategory or subcategory.category_id != category.id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -85,9 +96,58 @@ async def validate_owner(db, username=None, user_id=None):
     return owner
 
 
+def post_image_info(post_image, variants=tuple(IMAGE_VARIANTS)):
+    """
+    PostImageInfo of a PostImage with the urls of the requested variants,
+    `image` is the jpeg url of the first one.
+    """
+    return PostImageInfo(
+        id=post_image.id,
+        position=post_image.position,
+        image=variant_url(post_image.image, variants[0]),
+        **image_variant_urls(post_image.image, variants),
+    )
+
+
+async def attach_post_images(
+    db, post_id, staged: List[Tuple[str, str]], positions: List[int]
+) -> List[str]:
+    """
+    Add staged uploads to a post's images at the given positions.
+
+    Already stored content is attached right away, new content is handed to
+    the worker which saves the PostImage row once the image is processed.
+    Returns the ids of the processing jobs.
+    Entries are popped from `staged` once they're handed over, whatever is
+    left after a failure, a worker that couldn't be reached included, still
+    has to be discarded by the caller.
+    """
+    jobs = []
+    while staged:
+        staged_path, content_hash = staged[0]
+        position = positions[0]
+
+        # Already stored content is only referenced again, no processing needed
+        if await crud_stored_image.get(db, hash=content_hash):
+            image_url = await store_staged_image(db, staged_path, content_hash)
+            await crud_postimage.create(
+                db, obj_in=PostImageUpdate(post=post_id, image=image_url, position=position)
+            )
+        else:
+            task = await run_in_threadpool(
+                process_post_picture.delay, staged_path, content_hash, str(post_id), position
+            )
+            jobs.append(task.id)
+
+        staged.pop(0)
+        positions.pop(0)
+
+    return jobs
+
+
 async def prepare_post_data_for_response(db, post, include_images=True):
-    category = await crud_category.get(db, id=post.category_id)
-    subcategory = await crud_subcategory.get(db, id=post.sub_category_id)
+    category = await category_registry.get_category(db, id=post.category_id)
+    subcategory = await category_registry.get_subcategory(db, id=post.sub_category_id)
     owner = await crud_user.get(db, id=post.owner)
 
     post_data = post.dict()
@@ -102,8 +162,60 @@ async def prepare_post_data_for_response(db, post, include_images=True):
     )
 
     if include_images:
-        post_images = await crud_postimage.get_multi(db, post=post.id)
-        images_info = [PostImageInfo(image=image.image) for image in post_images]
-        post_data["images"] = images_info
+        post_images = await crud_postimage.get_post_images(db, post.id)
+        post_data["images"] = [post_image_info(image) for image in post_images]
 
     return post_data
+
+
+async def prepare_posts_data_for_response(
+    db, posts, include_images=True, image_variants=LISTING_IMAGE_VARIANTS
+):
+    """
+    Batched version of prepare_post_data_for_response for a page of posts.
+
+    Owners and images of the whole page are loaded with one IN-list query each and
+    categories come from the in-process registry, so the number of queries doesn't
+    depend on the page size.
+    """
+    if not posts:
+        return []
+
+    owners = {
+        owner.id: UserDataSchema(**owner.dict())
+        for owner in await crud_user.get_multi_in(
+            db, "id", [post.owner for post in posts]
+        )
+    }
+
+    images = defaultdict(list)
+    if include_images:
+        page_images = await crud_postimage.get_multi_in(
+            db, "post", [post.id for post in posts]
+        )
+        for image in sorted(page_images, key=lambda image: (image.position, image.id)):
+            images[image.post].append(post_image_info(image, image_variants))
+
+    result = []
+    for post in posts:
+        category = await category_registry.get_category(db, id=post.category_id)
+        subcategory = await category_registry.get_subcategory(
+            db, id=post.sub_category_id
+        )
+
+        post_data = post.dict()
+        post_data.update(
+            {
+                "category": category.title if category else "Category not found",
+                "subcategory": subcategory.title
+                if subcategory
+                else "Subcategory not found",
+                "owner": owners.get(post.owner),
+            }
+        )
+        if include_images:
+            post_data["images"] = images[post.id]
+
+        result.append(post_data)
+
+    return result
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import secrets
+
+from typing import List, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+from celery.result import AsyncResult
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+
+from configs.general import MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE, UPLOADS_STAGING_DIR
+from tasks.configs import celery_app
+from utils.images import ImageTooLargeError, image_pixels
+
+# Leading bytes of the accepted image formats -> extension the file is staged with
+IMAGE_SIGNATURES = {
+    b"\xff\xd8\xff": "jpg",
+    b"\x89PNG\r\n\x1a\n": "png",
+}
+
+
+def sniff_image_extension(header: bytes) -> Optional[str]:
+    """
+    Detect the image format from the file's magic bytes, the filename isn't trusted.
+    """
+    for signature, extension in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return extension
+    return None
+
+
+async def stage_upload(
+    file: UploadFile, max_size: int = MAX_UPLOAD_SIZE
+) -> Tuple[str, str]:
+    """
+    Copy an uploaded file to the staging directory chunk by chunk.
+
+    At most one chunk is held in memory, the size limit is enforced while
+    copying and the format is detected from the first chunk. The pixel limit
+    is checked from the image header once the file is staged. Only the path is
+    sent to the celery worker, the file content never goes through the broker.
+    Returns the staged path and the sha256 of the content.
+    """
+    if file.size is not None and file.size > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File is too large, max size is {max_size} bytes",
+        )
+
+    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    extension = sniff_image_extension(chunk)
+    if extension is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="File must be a .jpg or .png image",
+        )
+
+    os.makedirs(UPLOADS_STAGING_DIR, exist_ok=True)
+    staged_path = os.path.join(UPLOADS_STAGING_DIR, f"{secrets.token_hex(16)}.{extension}")
+
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        async with aiofiles.open(staged_path, mode="wb") as out_file:
+            while chunk:
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File is too large, max size is {max_size} bytes",
+                    )
+                digest.update(chunk)
+                await out_file.write(chunk)
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+
+        try:
+            await run_in_threadpool(image_pixels, staged_path)
+        except ImageTooLargeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e)
+            )
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="File must be a .jpg or .png image",
+            )
+    except BaseException:
+        await aiofiles.os.remove(staged_path)
+        raise
+
+    return staged_path, digest.hexdigest()
+
+
+async def discard_staged_uploads(staged_paths: List[str]):
+    for staged_path in staged_paths:
+        try:
+            await aiofiles.os.remove(staged_path)
+        except FileNotFoundError:
+            pass
+
+
+async def get_upload_job_status(job_id: str) -> dict:
+    """
+    Status of an image processing task, the result backend is read off the event loop.
+    """
+
+    def read_status():
+        result = AsyncResult(job_id, app=celery_app)
+        status = result.state
+        job = {"job_id": job_id, "status": status}
+        if status == "SUCCESS":
+            job["result"] = result.result
+        elif status == "FAILURE":
+            job["error"] = str(result.result)
+        return job
+
+    return await run_in_threadpool(read_status)
@@ -0,0 +1,124 @@
+"""
+Benchmark of the image variant generation on a corpus of large images.
+
+Every image is processed by utils.images.generate_variants twice per run, in
+a fresh process each time so the peak memory is the image's own:
+
+- full: decoding the whole bitmap first, as before reduced decoding,
+- reduced: the current draft mode / reduce decoding.
+
+Without --corpus, JPEG photos of 12, 24 and 48 megapixels and a 24 megapixel
+PNG are generated in a temporary directory. Run from the repository root with
+the app's environment:
+
+    PYTHONPATH=app python scripts/bench_images.py [--corpus DIR] [--runs 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+# Megapixels -> (width, height) of the generated corpus, 4:3 like phone photos
+GENERATED_SIZES = {12: (4000, 3000), 24: (5664, 4248), 48: (8000, 6000)}
+
+
+def generate_corpus(directory: str) -> list:
+    paths = []
+    for megapixels, size in GENERATED_SIZES.items():
+        # Noise over a gradient compresses and decodes roughly like a photo
+        noise = Image.effect_noise((size[0] // 4, size[1] // 4), 64).resize(size)
+        gradient = Image.linear_gradient("L").resize(size)
+        image = Image.merge("RGB", (noise, gradient, Image.blend(noise, gradient, 0.5)))
+        paths.append(os.path.join(directory, f"photo_{megapixels}mp.jpg"))
+        image.save(paths[-1], "JPEG", quality=90)
+        if megapixels == 24:
+            paths.append(os.path.join(directory, f"image_{megapixels}mp.png"))
+            image.save(paths[-1], "PNG", compress_level=1)
+    return paths
+
+
+def peak_memory_mb() -> float:
+    """
+    High-water mark of the resident memory of this process. Unlike ru_maxrss it
+    starts over at exec, so the parent's peak doesn't show through.
+    """
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError("VmHWM not found in /proc/self/status")
+
+
+def process(mode: str, path: str):
+    """
+    Child process: generate the variants of one image, print the duration and peak memory.
+    """
+    from utils import images
+
+    if mode == "full":
+        def decode_full(source, max_side):
+            source.load()
+            return source
+
+        images._decode_reduced = decode_full
+
+    with tempfile.TemporaryDirectory() as dest_dir:
+        peak_before = peak_memory_mb()
+        start = time.perf_counter()
+        images.generate_variants(path, dest_dir, "bench")
+        seconds = time.perf_counter() - start
+        peak = peak_memory_mb()
+
+    print(json.dumps({"seconds": seconds, "peak_mb": peak, "added_mb": peak - peak_before}))
+
+
+def run(mode: str, path: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--process", mode, path],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        if args.corpus:
+            paths = sorted(
+                os.path.join(args.corpus, name)
+                for name in os.listdir(args.corpus)
+                if name.lower().endswith((".jpg", ".jpeg", ".png"))
+            )
+        else:
+            paths = generate_corpus(directory)
+
+        print(f"{'image':<20} {'pixels':>7} {'mode':<8} {'median s':>9} {'peak MB':>8} {'added MB':>9}")
+        for path in paths:
+            with Image.open(path) as image:
+                megapixels = image.width * image.height / 1_000_000
+            for mode in ("full", "reduced"):
+                results = [run(mode, path) for _ in range(args.runs)]
+                print(
+                    f"{os.path.basename(path)[:20]:<20} {megapixels:>6.1f}M {mode:<8} "
+                    f"{statistics.median(r['seconds'] for r in results):>9.2f} "
+                    f"{max(r['peak_mb'] for r in results):>8.0f} "
+                    f"{max(r['added_mb'] for r in results):>9.0f}"
+                )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--process":
+        process(sys.argv[2], sys.argv[3])
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="directory of JPEG / PNG images, generated when omitted")
+    parser.add_argument("--runs", type=int, default=3)
+    main(parser.parse_args())
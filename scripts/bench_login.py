@@ -0,0 +1,88 @@
+"""
+Load test of the login endpoint against a running API.
+
+Samples the latency of another endpoint (--probe-path) while the API is idle,
+then again while --concurrency clients log in back to back, and reports the
+probe percentiles, the logins per second and their status codes (503 when
+the password hashing queue is full).
+
+    python scripts/bench_login.py http://localhost:8000 --username bench --password secret
+"""
+import argparse
+import asyncio
+import collections
+import statistics
+import time
+
+import httpx
+
+LOGIN_PATH = "/api/v1/users/auth/token"
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def probe(client: httpx.AsyncClient, path: str, duration: float, interval: float) -> list:
+    latencies = []
+    stop_at = time.perf_counter() + duration
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def log_in(client: httpx.AsyncClient, username: str, password: str, stop: asyncio.Event, statuses):
+    while not stop.is_set():
+        response = await client.post(LOGIN_PATH, data={"username": username, "password": password})
+        statuses[response.status_code] += 1
+
+
+def report(name: str, latencies: list):
+    print(
+        f"{name:<14} {len(latencies):>7} {statistics.median(latencies):>8.1f} "
+        f"{percentile(latencies, 0.99):>8.1f} {max(latencies):>8.1f}"
+    )
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        response = await client.post(LOGIN_PATH, data={"username": args.username, "password": args.password})
+        response.raise_for_status()
+
+        idle = await probe(client, args.probe_path, args.duration, args.probe_interval)
+
+        stop, statuses = asyncio.Event(), collections.Counter()
+        burst = [
+            asyncio.create_task(log_in(client, args.username, args.password, stop, statuses))
+            for _ in range(args.concurrency)
+        ]
+        start = time.perf_counter()
+        loaded = await probe(client, args.probe_path, args.duration, args.probe_interval)
+        stop.set()
+        await asyncio.gather(*burst)
+        seconds = time.perf_counter() - start
+
+    print(f"probe {args.probe_path}")
+    print(f"{'':<14} {'samples':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    report("idle", idle)
+    report("login burst", loaded)
+    logins = sum(statuses.values())
+    print(f"{logins} logins by {args.concurrency} clients, {logins / seconds:.1f}/s, statuses {dict(statuses)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base_url", help="e.g. http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=50, help="clients logging in at once")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of each phase")
+    parser.add_argument("--probe-path", default="/api/openapi.json")
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="seconds between probes")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,124 @@
+"""
+Benchmark of email delivery against a local SMTP stand-in.
+
+Sends the same batch of messages twice and reports messages/sec and the number
+of connections the server saw:
+
+- before: one message at a time, each over a new authenticated connection,
+  as FastMail did,
+- pooled: services.smtp.SMTPPool.send_many, concurrent over reused connections.
+
+The stand-in accepts any login and message. --latency delays each of its
+replies to stand for the round trip to a remote server (0 for loopback only).
+Run from the repository root with the app's environment:
+
+    PYTHONPATH=app python scripts/bench_smtp.py [--messages 200] [--pool-size 4] [--latency 20]
+"""
+import argparse
+import asyncio
+import time
+
+import aiosmtplib
+
+from services.email import build_message
+from services.smtp import SMTPPool
+
+
+class SMTPStandIn:
+    """
+    Minimal SMTP server: EHLO with AUTH, any credentials, any message.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = 0
+        self.messages = 0
+
+    async def reply(self, writer, line: bytes):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        writer.write(line)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            await self.session(reader, writer)
+        except asyncio.CancelledError:
+            # Pooled connections still open when the benchmark ends
+            pass
+        finally:
+            writer.close()
+
+    async def session(self, reader, writer):
+        await self.reply(writer, b"220 stand-in ready\r\n")
+        in_data = False
+        while line := await reader.readline():
+            if in_data:
+                if line == b".\r\n":
+                    in_data = False
+                    self.messages += 1
+                    await self.reply(writer, b"250 queued\r\n")
+                continue
+
+            command = line[:4].upper()
+            if command == b"EHLO":
+                await self.reply(writer, b"250-stand-in\r\n250-8BITMIME\r\n250 AUTH PLAIN\r\n")
+            elif command == b"AUTH":
+                await self.reply(writer, b"235 authenticated\r\n")
+            elif command == b"DATA":
+                in_data = True
+                await self.reply(writer, b"354 go ahead\r\n")
+            elif command == b"QUIT":
+                await self.reply(writer, b"221 bye\r\n")
+                return
+            else:
+                await self.reply(writer, b"250 ok\r\n")
+
+
+async def main(args):
+    server = SMTPStandIn(args.latency / 1000)
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    smtp_options = dict(
+        hostname="127.0.0.1",
+        port=listener.sockets[0].getsockname()[1],
+        username="bench",
+        password="bench",
+        start_tls=False,
+        use_tls=False,
+        timeout=30,
+    )
+    messages = [
+        build_message(f"user{i}@example.com", "Benchmark", f"<p>Message {i}</p>")
+        for i in range(args.messages)
+    ]
+
+    async def before():
+        for message in messages:
+            await aiosmtplib.send(message, **smtp_options)
+
+    async def pooled():
+        pool = SMTPPool(size=args.pool_size, idle_timeout=60, **smtp_options)
+        errors = await pool.send_many(messages)
+        assert not any(errors), errors
+
+    print(f"{'mode':<8} {'messages':>8} {'seconds':>8} {'msg/s':>8} {'connections':>11}")
+    for name, send in (("before", before), ("pooled", pooled)):
+        server.connections = server.messages = 0
+        start = time.perf_counter()
+        await send()
+        seconds = time.perf_counter() - start
+        print(
+            f"{name:<8} {server.messages:>8} {seconds:>8.2f} "
+            f"{server.messages / seconds:>8.0f} {server.connections:>11}"
+        )
+    # Not waiting for the pooled connections, they stay open until the process exits
+    listener.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=4, help="EMAIL_SMTP_POOL_SIZE")
+    parser.add_argument("--latency", type=float, default=20, help="milliseconds before each server reply")
+    asyncio.run(main(parser.parse_args()))
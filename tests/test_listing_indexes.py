@@ -0,0 +1,233 @@
+"""
+EXPLAIN checks that the post listing and search queries are served by the
+indexes declared in models/posts.py.
+
+Runs against an empty scratch postgres database given by TEST_DATABASE_URL
+(postgresql+asyncpg://...), skipped otherwise. The tables are created in a
+dedicated schema that is dropped afterwards.
+"""
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if not TEST_DATABASE_URL:
+    pytest.skip("TEST_DATABASE_URL isn't set", allow_module_level=True)
+
+from sqlalchemy import event, text  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.pool import NullPool  # noqa: E402
+
+from models import emails, images, posts, store, tokens, users  # noqa: E402, F401
+from crud.posts import crud_post  # noqa: E402
+from db.db import Base  # noqa: E402
+
+SCHEMA = "explain_tests"
+POSTS = 100_000
+# Few posts per user, as POSTS_LIMIT / VIPS_POSTS_LIMIT keep it in production
+USERS = 10_000
+
+engine = create_async_engine(
+    TEST_DATABASE_URL,
+    poolclass=NullPool,
+    connect_args={"server_settings": {"search_path": f"{SCHEMA},public"}},
+)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+SEED = [
+    f"""
+    INSERT INTO users (id, username, password, first_name, email, joined_at,
+                       is_activated, is_vip, is_staff, image)
+    SELECT gen_random_uuid(), 'user' || i, 'x', 'user', 'user' || i || '@example.com',
+           current_date, true, i % 10 = 0, false, 'avatar.png'
+    FROM generate_series(1, {USERS}) AS i
+    """,
+    """
+    INSERT INTO categories (id, title, slug)
+    SELECT i, 'category ' || i, 'category-' || i FROM generate_series(1, 10) AS i
+    """,
+    """
+    INSERT INTO subcategories (id, category_id, title, slug)
+    SELECT i, 1 + (i - 1) % 10, 'subcategory ' || i, 'subcategory-' || i
+    FROM generate_series(1, 50) AS i
+    """,
+    f"""
+    INSERT INTO posts (id, owner, category_id, sub_category_id, title, slug, price,
+                       description, created_at, is_vip)
+    SELECT gen_random_uuid(), owners.ids[1 + i % {USERS}], 1 + i % 10, 1 + i % 50,
+           'post ' || md5(i::text), 'post-' || i, (i % 100000) / 100.0,
+           'description ' || md5((i * 7)::text), now() - i * interval '1 minute', i % 20 = 0
+    FROM generate_series(1, {POSTS}) AS i, (SELECT array_agg(id) AS ids FROM users) AS owners
+    """,
+]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def database():
+    async def setup():
+        async with engine.begin() as connection:
+            await connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+            await connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public"))
+            await connection.run_sync(Base.metadata.create_all)
+            for statement in SEED:
+                await connection.execute(text(statement))
+            await connection.execute(text("ANALYZE"))
+
+    async def teardown():
+        async with engine.begin() as connection:
+            await connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+    run(setup())
+    yield
+    run(teardown())
+
+
+async def explain(call) -> dict:
+    """
+    Plan of the last SELECT run by `call(session)`, explained with the very
+    statement and parameters the CRUD method sent.
+    """
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        async with Session() as session:
+            await call(session)
+            statement, parameters = statements[-1]
+            connection = await session.connection()
+            result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+            plan = result.scalar()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def index_nodes(plan: dict, index: str) -> list:
+    return [node for node in plan_nodes(plan) if node.get("Index Name") == index]
+
+
+@pytest.mark.parametrize(
+    "order_by, index",
+    [
+        ("newest", "ix_posts_newest"),
+        ("oldest", "ix_posts_oldest"),
+        ("cheapest", "ix_posts_cheapest"),
+        ("expensive", "ix_posts_expensive"),
+    ],
+)
+def test_offset_listing_walks_the_sort_index(order_by, index):
+    plan = run(
+        explain(
+            lambda db: crud_post.get_multi_filtered(
+                db, offset=40, limit=20, order_by=order_by, count_strategy="none"
+            )
+        )
+    )
+
+    assert index_nodes(plan, index), json.dumps(plan, indent=2)
+    assert not [node for node in plan_nodes(plan) if node["Node Type"] == "Sort"]
+
+
+@pytest.mark.parametrize(
+    "order_by, index, sort_value",
+    [
+        ("newest", "ix_posts_newest", datetime(2020, 1, 1)),
+        ("oldest", "ix_posts_oldest", datetime(2020, 1, 1)),
+        ("cheapest", "ix_posts_cheapest", Decimal("12.50")),
+        ("expensive", "ix_posts_expensive", Decimal("12.50")),
+    ],
+)
+def test_keyset_listing_seeks_into_the_sort_index(order_by, index, sort_value):
+    cursor = (False, sort_value, uuid.uuid4())
+    plan = run(
+        explain(
+            lambda db: crud_post.get_multi_keyset(db, cursor=cursor, limit=20, order_by=order_by)
+        )
+    )
+
+    nodes = index_nodes(plan, index)
+    assert nodes, json.dumps(plan, indent=2)
+    # The seek starts the scan, rows before the cursor aren't read and filtered out
+    assert "Index Cond" in nodes[0], json.dumps(plan, indent=2)
+    assert not [node for node in plan_nodes(plan) if node["Node Type"] == "Sort"]
+
+
+def test_owner_listing_uses_the_owner_index():
+    async def call(db):
+        owner = await db.scalar(text("SELECT id FROM users ORDER BY username LIMIT 1"))
+        await crud_post.get_multi_filtered(
+            db, limit=20, order_by="newest", owner=owner, count_strategy="none"
+        )
+
+    plan = run(explain(call))
+
+    assert index_nodes(plan, "ix_posts_owner_created_at"), json.dumps(plan, indent=2)
+
+
+def test_category_listing_uses_the_category_index():
+    plan = run(
+        explain(
+            lambda db: crud_post.get_multi_filtered(
+                db, limit=20, order_by="newest", category=3, subcategory=13, count_strategy="none"
+            )
+        )
+    )
+
+    assert index_nodes(plan, "ix_posts_category_subcategory"), json.dumps(plan, indent=2)
+
+
+def test_title_filter_uses_the_trigram_index():
+    plan = run(
+        explain(
+            lambda db: crud_post.get_multi_filtered(
+                db, limit=20, order_by="newest", title="c4ca4238", count_strategy="none"
+            )
+        )
+    )
+
+    assert index_nodes(plan, "ix_posts_title_trgm"), json.dumps(plan, indent=2)
+
+
+def test_search_uses_the_full_text_index():
+    plan = run(explain(lambda db: crud_post.search(db, "c4ca4238a0b923820dcc509a6f75849b", limit=20)))
+
+    assert index_nodes(plan, "ix_posts_search"), json.dumps(plan, indent=2)
+
+
+def test_price_range_is_an_index_condition():
+    # The route passes floats, they must not turn into a cast of the numeric column
+    plan = run(
+        explain(
+            lambda db: crud_post.get_multi_filtered(
+                db, limit=20, order_by="cheapest", min_price=100.0, max_price=150.0, count_strategy="none"
+            )
+        )
+    )
+
+    nodes = index_nodes(plan, "ix_posts_cheapest")
+    assert nodes, json.dumps(plan, indent=2)
+    assert "price" in nodes[0].get("Index Cond", ""), json.dumps(plan, indent=2)